@@ -80,6 +80,28 @@ else:
     parser.add_option("--pass", dest="passS1", action="store", type="string", default='None',
                       help="Passes. The comma can be used for multiple selections. Track and Pass must be the same length. Default: None")
 
+    parser.add_option("--nbworkers", dest="nbworkers", action="store", type="int", default=4,
+                      help="Number of concurrent downloads. Default: 4")
+    parser.add_option("--ratelimit", dest="ratelimit", action="store", type="float", default=1.0,
+                      help="Maximal number of download requests per second (shared by the workers, reduced automatically if the server throttles). Default: 1.0")
+
+    parser.add_option("--nbunzipworkers", dest="nbunzipworkers", action="store", type="int", default=4,
+                      help="Number of processes used to unzip the files. Default: 4")
+    parser.add_option("--streaming", dest="streaming", action="store_true", default=False,
+                      help="Unzip the files during the download without writing the .zip files in the output directory. Default: False")
+    parser.add_option("--tmpdir", dest="tmpdir", action="store", type="string", default=None,
+                      help="Temporary directory used by the streaming mode for the large files. Default: system temporary directory")
+
+    parser.add_option("--cachedir", dest="cachedir", action="store", type="string", default=None,
+                      help="Directory of the tile cache shared by the projects. Default: EGMSTILECACHE variable (no cache if not defined)")
+    parser.add_option("--cachesize", dest="cachesize", action="store", type="float", default=None,
+                      help="Maximal size of the tile cache in GB (the least recently used tiles are removed). Default: EGMSTILECACHESIZE variable or 100")
+
+    parser.add_option("--dryrun", dest="dryrun", action="store_true", default=False,
+                      help="Only plan the job: list of files, volume to download, disk space and time (no download). Default: False")
+    parser.add_option("--bandwidth", dest="bandwidth", action="store", type="float", default=10.0,
+                      help="Bandwidth in MB/s used to estimate the download time of the dry run. Default: 10.0")
+
     parser.add_option("--nodownload", dest="download", action="store_false", default=True,
                       help="Block the downloading of the files. Default: False")
     parser.add_option("--nounzip", dest="unzip", action="store_false", default=True,
@@ -90,6 +112,12 @@ else:
                       help="Block the merging of the EGMS results. Default: False")
     parser.add_option("--noclipping", dest="clipping", action="store_false", default=True,
                       help="Block the clipping/croppring of the EGMS results. Default: False")
+    parser.add_option("--mergeformat", dest="mergeformat", action="store", type="string", default='csv',
+                      help="Format of the merged files [csv, parquet or feather]. The parquet and feather formats need the pyarrow package. Default: csv")
+    parser.add_option("--nbmergeworkers", dest="nbmergeworkers", action="store", type="int", default=4,
+                      help="Number of processes used to merge the tracks/components. Default: 4")
+    parser.add_option("--maxmemory", dest="maxmemory", action="store", type="float", default=None,
+                      help="Memory budget in MB for the merging (fewer tracks/components are merged at the same time if needed, the .csv files are read by chunks fitting in the budget). Default: available memory")
     
     parser.add_option("--clean", dest="clean", action="store_true", default=False,
                       help="Clean the raw-data files. Default: False")
@@ -132,6 +160,13 @@ if options.example == False:
         else: 
             print('\tThe data files wil not be downloaded. The following user parameters will be ignored.')
 
+        if options.download: 
+            print('\tNumber of concurrent downloads: %d' % (options.nbworkers))
+            print('\tMaximal rate of the download requests: %.2f per s' % (options.ratelimit))
+
+        if options.download and options.streaming: 
+            print('\tThe data files will be unzipped during the download (streaming mode).')
+
         if options.unzip and options.download: 
             print('\tThe data files will be unzipped.')
         else: 
@@ -144,6 +179,10 @@ if options.example == False:
 
         if options.merging and options.unzip and options.download: 
             print('\tThe data files will be merged (based on the files)')
+            print('\t\tFormat of the merged files: %s' % (options.mergeformat))
+            print('\t\tNumber of processes for the merging: %d' % (options.nbmergeworkers))
+            if not options.maxmemory is None:
+                print('\t\tMemory for the merging: %.0f MB' % (options.maxmemory))
         else:
             print('\tThe data files will NOT be merged. The following user parameters will be ignored.')
 
@@ -255,57 +294,54 @@ if options.example == False:
             h = h + 1
         
 
-    h = 1
     downloadpara = EGMSdownloaderapi.egmsdownloader()
     downloadpara.verbose = options.verbose 
 
-    check_dectection = False
-    for bboxi in list_bbox:
-
-        ROIpara = EGMSS1ROIapi.S1ROIparameter()
-        ROIpara.verbose = options.verbose
-
-        ROIpara.bbox = bboxi
-        ROIpara.createROI()
+    # All the ROIs are resolved together (one search per level)
+    ROIpara = EGMSS1ROIapi.S1ROIparameter()
+    ROIpara.verbose = options.verbose
 
-        levellist = np.unique(options.level.split(','))
+    dictROI = dict(zip(range(1,len(list_bbox)+1),list_bbox))
 
-        for leveli in options.level.split(','):
-            if 'UD' in leveli: 
-                ROIpara.egmslevel = 'L3'
-                ROIpara.egmsL3component = 'UD'
-            elif 'EW' in leveli: 
-                ROIpara.egmslevel = 'L3'
-                ROIpara.egmsL3component = 'EW'
-            else:
-                ROIpara.egmslevel = leveli
-
-            if check_dectection == False or ROIpara.egmslevel != 'L3': 
-                tracklist = options.track.split(',')
-                passlist = options.passS1.split(',')
-               
-                if not check_dectection:
-                    if 'None' in tracklist  and 'None' in passlist:
-                        ROIpara.detectfromIDmap(infoburstID=info)
-                        check_dectection = True
-                    else:
-                        ROIpara.detectfromIDmap(infoburstID=info,Track=[eval(tii) for tii in tracklist],Pass=passlist)
-                        check_dectection = True
+    tracklist = options.track.split(',')
+    passlist = options.passS1.split(',')
 
+    check_dectection = False
+    for leveli in options.level.split(','):
+        if 'UD' in leveli: 
+            ROIpara.egmslevel = 'L3'
+            ROIpara.egmsL3component = 'UD'
+        elif 'EW' in leveli: 
+            ROIpara.egmslevel = 'L3'
+            ROIpara.egmsL3component = 'EW'
+        else:
+            ROIpara.egmslevel = leveli
+
+        # The bursts are the same for L2a and L2b: only one search
+        if ROIpara.egmslevel == 'L3':
+            ROIpara.detectfromIDmapbatch(infoburstID=info,ROIs=dictROI)
+        elif not check_dectection:
+            if 'None' in tracklist  and 'None' in passlist:
+                ROIpara.detectfromIDmapbatch(infoburstID=info,ROIs=dictROI)
             else:
-                ROIpara.detectfromIDmap(infoburstID=info)
-                check_dectection = True
-            
-            for releasei in options.release.split(','):
-                ROIpara.release = releasei
-                downloadpara.updatelist(infoS1ROIparameter=ROIpara)
+                ROIpara.detectfromIDmapbatch(infoburstID=info,ROIs=dictROI,Track=[eval(tii) for tii in tracklist],Pass=passlist)
+            check_dectection = True
+        
+        for releasei in options.release.split(','):
+            ROIpara.release = releasei
+            downloadpara.updatelist(infoS1ROIparameter=ROIpara)
 
-        # ROIpara.displaymap(output='fig_search_%d.jpg' %(h))
-        h = h + 1
+    # ROIpara.displaymap(output='fig_search.jpg')
 
     if options.verbose:
         downloadpara.printlist()        
     
+    # Plan the job without downloading (dry run)
+    if options.dryrun:
+        downloadpara.token = options.token
+        downloadpara.plan(outputdir=options.outputdir,nbworkers=options.nbworkers,ratelimit=options.ratelimit,bandwidth=options.bandwidth,streaming=options.streaming)
+        sys.exit(0)
+
     ###########################################################################
     # (3) Download the EGMS data
 
@@ -314,23 +350,23 @@ if options.example == False:
     
     # Download (and unzip) the files
     if options.download: 
-        downloadpara.download(outputdir=options.outputdir,unzip=False,clean=False) 
+        downloadpara.download(outputdir=options.outputdir,unzip=False,clean=False,nbworkers=options.nbworkers,ratelimit=options.ratelimit,streaming=options.streaming,tmpdir=options.tmpdir,cachedir=options.cachedir,cachesize=options.cachesize) 
 
     # Unzip the files
     if options.download and options.unzip:
-        downloadpara.unzipfile(outputdir=options.outputdir,unzip=True,clean=options.nokeepzip) 
+        downloadpara.unzipfile(outputdir=options.outputdir,unzip=True,clean=not options.nokeepzip,nbworkers=options.nbunzipworkers) 
   
     ###########################################################################
     # (4) Post-process of the files (all these steps are optional)
     
     # Merge the .csv files 
     if options.download and options.unzip and options.merging:
-        egmsdatatools.datamergingcsv(infoEGMSdownloader=downloadpara,inputdir=options.outputdir,outputdir=options.outputdir,mode='onfiles',verbose=options.verbose,paratosave='all') 
-        egmsdatatools.datamergingtiff(infoEGMSdownloader=downloadpara,inputdir=options.outputdir,outputdir=options.outputdir,mode='onfiles',verbose=options.verbose)
+        egmsdatatools.datamergingcsv(infoEGMSdownloader=downloadpara,inputdir=options.outputdir,outputdir=options.outputdir,mode='onfiles',verbose=options.verbose,paratosave='all',outputformat=options.mergeformat,nbworkers=options.nbmergeworkers,maxmemory=options.maxmemory) 
+        egmsdatatools.datamergingtiff(infoEGMSdownloader=downloadpara,inputdir=options.outputdir,outputdir=options.outputdir,mode='onfiles',verbose=options.verbose,nbworkers=options.nbmergeworkers,maxmemory=options.maxmemory)
     
     # Clip/crop the data
     if options.download and options.unzip and options.merging and options.clipping:
-        egmsdatatools.dataclipping(inputdir=options.outputdir,outputdir=options.outputdir,file='all',shapefile='bbox.shp',verbose=options.verbose)
+        egmsdatatools.dataclipping(inputdir=options.outputdir,outputdir=options.outputdir,file='all',infoS1ROIparameter=ROIpara,verbose=options.verbose)
 
     # Clean the raw data
     if options.clean: 
@@ -366,7 +402,7 @@ else:
     "info.verbose = False # or False\n",
     "\n",
     "# Download the latest ID map\n",
-    "info.downloadfile()\n",
+    "info.downloadfile() # Or info.downloadfile(update=True) to check if a newer map is available\n",
     "\n",
     "###########################################################################\n",
     "# (2) Check the tile/bursts available according the user imputs\n",
@@ -386,14 +422,15 @@ else:
     "ROIpara.release = '2018_2022' # Release of EGMS data\n",
     "\n",
     "# Create the ROI file\n",
-    "ROIpara.createROI()\n",
+    "ROIpara.createROI() # Or ROIpara.createROI(output='bbox.shp') to export the ROIs into a vector file, ROIpara.createROI(tolerance=0.01) for simplified country boundaries\n",
     "\n",
     "# Detect the burst ID\n",
     "ROIpara.detectfromIDmap(infoburstID=info,Track=1,Pass='Ascending')\n",
     "    # Track: track number or list of number\n",
     "    # Pass: [Ascending or Descending] or list of string\n",
+    "    # cache: reuse the results of the same search stored in the query cache [True or False]\n",
     "\n",
-    "# Save the burst ID list\n",
+    "# Save the burst ID list (not needed for the same search: the results are kept in the query cache)\n",
     "ROIpara.saveIDlistL2() # Or ROIpara.saveIDlistL2(input=saveseach.pkl)\n",
     "\n",
     "# Load the burst ID list\n",
@@ -420,6 +457,10 @@ else:
     "# Print the list of files\n",
     "downloadpara.printlist()\n",
     "\n",
+    "# Detect the burst IDs of several ROIs in one search (ID => bbox, country, vector file or shapely geometry)\n",
+    "# results = ROIpara.detectfromIDmapbatch(infoburstID=info,ROIs={'Dublin': [-6.43,53.26,-6.10,53.42], 'Cork': [-8.55,51.85,-8.35,51.95]})\n",
+    "    # results[ID]['Data'] and results[ID]['DataL3']: bursts and tiles of each ROI; ROIpara.Data and ROIpara.DataL3: union of the ROIs\n",
+    "\n",
     "# Possibility to concatenante other research\n",
     "ROIpara.egmslevel = 'L3'\n",
     "ROIpara.egmsL3component = 'UD'\n",
@@ -435,17 +476,32 @@ else:
     "# Change the user token \n",
     "downloadpara.token = 'xxxx'\n",
     "\n",
+    "# Plan the download (dry run): files, volume, disk space and time\n",
+    "downloadpara.plan() # or downloadpara.plan(outputdir='./Output',nbworkers=4,ratelimit=1.0,bandwidth=10.0,streaming=False)\n",
+    "    # bandwidth: bandwidth in MB/s used to estimate the download time [10.0]\n",
+    "    # The sizes are stored in the size catalog of the output directory (egmssizecatalog.json)\n",
+    "\n",
     "# Download (and unzip) the files\n",
     "downloadpara.download() # or downloadpara.download(outputdir='./Output',unzip=True,clean=True) \n",
     "    # outputdir: output directory [./Output]\n",
     "    # unzip: unzipping of the downloaded files [True or False]\n",
     "    # clean: remove the .zip files [True or False]\n",
+    "    # nbworkers: number of concurrent downloads [4]\n",
+    "    # ratelimit: maximal number of requests per second, reduced automatically if the server throttles [1.0]\n",
+    "    # force: download the files even if the manifest of the output directory (egmsmanifest.sqlite3) or the unzipped files show them as done [False]\n",
+    "    # streaming: unzip the files during the download, the .zip files are never written in the output directory [True or False]\n",
+    "    # tmpdir: temporary directory used by the streaming mode for the large files [system temporary directory]\n",
+    "    # cachedir: directory of the tile cache shared by the projects [EGMSTILECACHE variable, no cache if not defined]\n",
+    "    # cachesize: maximal size of the tile cache in GB [EGMSTILECACHESIZE variable or 100]\n",
     "\n",
     "# Unzip the files\n",
     "downloadpara.unzipfile() # or downloadpara.download(outputdir='./Output',unzip=True,clean=True) \n",
     "    # outputdir: output directory [./Output]\n",
     "    # unzip: unzipping of the downloaded files [True or False]\n",
     "    # clean: remove the .zip files [True or False]\n",
+    "    # nbworkers: number of processes used to unzip the files [4]\n",
+    "    # force: unzip again the files already unzipped [False]\n",
+    "    # Only the new or modified .zip files are unzipped.\n",
 
     "# Clean the used files, remove the files that are not in the lists\n",
     "# downloadpara.clean() # or downloadpara.clean(outputdir='./Output) \n",
@@ -461,6 +517,9 @@ else:
     "    # mode: merge the files regarding the files available (onfiles) or on the list [onlist or onfiles]\n",
     "    # verbose [True or False]\n",
     "    # paratosave: extraction of parameter regarding the EGMS names ['all' or string value]. ['latitude', 'longitude', 'easting', 'northing', 'height', 'height_wgs84'] will always be saved.\n",
+    "    # outputformat: format of the merged files, parquet and feather with float32 time series (pyarrow package required) [csv, parquet or feather]\n",
+    "    # nbworkers: number of processes, one track/component per process [4]\n",
+    "    # maxmemory: memory budget in MB for the tracks/components merged at the same time, also sets the number of rows read at once [None: available memory, chunks of 100000 rows]\n",
     "\n",
     "# Merge the .tiff files (only for the L3 levels)\n",
     "egmsdatatools.datamergingtiff(infoEGMSdownloader=downloadpara,inputdir='./Output',outputdir='./Output',mode='onlist',verbose=True) # or egmsdatatools.datamergingtiff()\n",
@@ -469,13 +528,17 @@ else:
     "    # inputdir: inputdir directory [./Output]\n",
     "    # mode: merge the files regarding the files available (onfiles) or on the list [onlist or onfiles]\n",
     "    # verbose [True or False]\n",
+    "    # nbworkers: number of processes, one L3 component per process [4]\n",
+    "    # maxmemory: memory in MB for the components merged at the same time [None: available memory]\n",
+    "    # Both functions return the errors of the tracks/components not merged (dict)\n",
     "\n",
     "# Clip/crop the data\n",
-    "egmsdatatools.dataclipping(inputdir='./Output',outputdir='./Output',file='all',shapefile='bbox.shp',verbose=True)\n",
+    "egmsdatatools.dataclipping(inputdir='./Output',outputdir='./Output',file='all',infoS1ROIparameter=ROIpara,verbose=True) # Or shapefile='bbox.shp' instead of infoS1ROIparameter\n",
     "    # outputdir: output directory [./Output]\n",
     "    # inputdir: inputdir directory [./Output]\n",
     "    # file: list of files for clipping or cropping, they must not to have the '_cropped' or '_clipped' in their names, not in the paths [all] \n",
     "    # shapefile: EPGS:4326 shapefile with the ROI [bbox or name files]\n",
+    "    # infoS1ROIparameter: S1ROIparameter variable with the ROIs in memory (used instead of the shapefile)\n",
     "    # verbose [True or False]", 
     "\n",
     "# Delete the raw-data directorie\n",
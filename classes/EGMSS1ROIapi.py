@@ -7,6 +7,7 @@ import os
 import sys
 import warnings
 from shapely.geometry import Polygon, mapping, shape, LineString
+from shapely.geometry.base import BaseGeometry
 from osgeo import gdal
 from osgeo import ogr
 import fiona
@@ -17,10 +18,15 @@ from alive_progress import alive_bar
 import warnings
 import pickle
 import pyproj
+import shapely
 import plotly.graph_objects as go
 from numpy.matlib import repmat
 
-from functions import esa2egmsburstID
+from functions import egmsburstindex
+from functions import egmsquerycache
+from functions import egmsbursttable
+from functions import egmsroitools
+from functions import egmscountrystore
 
 source_crs = 'epsg:4326'
 target_crs = 'epsg:3035'
@@ -39,10 +45,11 @@ class S1ROIparameter:
     def __init__(self):
         self.bbox = 'None'
         self.ROIs = []
+        self.ROIsepsg3035 = []
         self.egmslevel = 'L2a'
         self.egmsL3component = 'UD'
         self.release = '2018_2022'
-        self.Data = dict()
+        self.Data = egmsbursttable.egmsbursttable()
         self.DataL3 = dict()
         self.workdirectoy = ''
        
@@ -74,66 +81,75 @@ class S1ROIparameter:
             print('Error: The verbose parameter is not correct (in EGMSROIapi.py)')
 
     ################################################################################
-    ## Function to create the ROI file
+    ## Function to create the ROIs (polygons in memory, optional export into a file)
     ################################################################################
-    def createROI(self): 
+    def createROI(self,**kwargs): 
     
         self.checkparameter()
 
         if self.verbose:
-            print('EMGStoolkit.py => EGMSS1ROIapi: create the ROI file for searching')
+            print('EMGStoolkit.py => EGMSS1ROIapi: create the ROIs for searching')
+
+        if not "output" in kwargs:
+            output = 'None'
+        else: 
+            output = kwargs['output']
+
+        if not "tolerance" in kwargs:
+            tolerance = 0.0
+        else: 
+            tolerance = kwargs['tolerance']
 
         if self.bbox == 'None':
             sys.exit('ERROR: the bbox is empty.')
 
-        if os.path.isfile('bbox.cpg'): 
-            os.remove('bbox.cpg')
-        if os.path.isfile('bbox.dbf'): 
-            os.remove('bbox.dbf')
-        if os.path.isfile('bbox.prj'): 
-            os.remove('bbox.prj')
-        if os.path.isfile('bbox.shp'): 
-            os.remove('bbox.shp')
-        if os.path.isfile('bbox.shx'): 
-            os.remove('bbox.shx')
-
         ## Create the polygons of the ROIs
         if isinstance(self.bbox, list):
             if self.verbose:
                 print('\tUse the bbox given by the user')
 
-            schema = {'geometry': 'MultiLineString','properties': {'FID': 'int'}}
-            
-            multi = loads("MULTILINESTRING ((%f %f, %f %f, %f %f, %f %f, %f %f))" % (
-                self.bbox[0], self.bbox[1],
-                self.bbox[2],self.bbox[1],
-                self.bbox[2],self.bbox[3],
-                self.bbox[0], self.bbox[3],
-                self.bbox[0], self.bbox[1]))
-
-            with fiona.open('bbox.shp', mode='w', driver='ESRI Shapefile',schema = schema, crs = "EPSG:4326")  as output:
-                output.write({'geometry':mapping(multi),'properties': {'FID':1}})
+            self.ROIs = [Polygon([(self.bbox[0], self.bbox[1]),
+                                  (self.bbox[2], self.bbox[1]),
+                                  (self.bbox[2], self.bbox[3]),
+                                  (self.bbox[0], self.bbox[3]),
+                                  (self.bbox[0], self.bbox[1])])]
 
         elif os.path.isfile(self.bbox):
             if self.verbose:
                 print('\tUse the vector file giving by the user: %s' % (self.bbox))
-            gdal.VectorTranslate('bbox.shp',self.bbox,options='-f "ESRI Shapefile" -t_srs "EPSG:4326"')
+            self.ROIs = egmsroitools.readROIfile(self.bbox)
         
-        elif isinstance(self.bbox, str): # ERROR
+        elif isinstance(self.bbox, str):
             if self.verbose:
                 print('\tUse the country name given by the user')
 
-            cmd = 'gmt coast -JU6i -E%s -M > bbox.GMT' % (self.bbox)
-            os.system(cmd)
-            gdal.VectorTranslate('bbox.shp','bbox.GMT',options='-f "ESRI Shapefile" -s_srs "EPSG:4326" -t_srs "EPSG:4326" -overwrite')
-
-            os.remove('bbox.GMT')
-            os.remove('gmt.history')
+            # From the local store of the country boundaries, GMT only for the codes not yet stored
+            countrystore = egmscountrystore.opencountrystore()
+            self.ROIs = []
+            for codei in self.bbox.split(','):
+                ROIsi = countrystore.lookup(codei,tolerance)
+                if ROIsi is None:
+                    if self.verbose:
+                        print('\t\t%s: not in the country store, use GMT' % (codei))
+                    ROIsi = egmscountrystore.fromgmt(codei)
+                    if ROIsi is None:
+                        countrystore.close()
+                        sys.exit('Error: the country %s is not in the country store (%s) and GMT cannot provide it.' % (codei,countrystore.pathstore))
+                    countrystore.put(codei,ROIsi,source='gmt')
+                    ROIsi = countrystore.lookup(codei,tolerance)
+                self.ROIs = self.ROIs + ROIsi
+            countrystore.close()
 
         else: 
-            sys.exit('ERROR: the format is not recognised (in EGMSS1ROIapi: create the ROI file for searching).')
-        
-        self.ROIs = 'bbox.shp'
+            sys.exit('ERROR: the format is not recognised (in EGMSS1ROIapi: create the ROIs for searching).')
+
+        ## Polygons in EPSG:3035 (densified: a straight edge in lat/lon is curved in EPSG:3035)
+        self.ROIsepsg3035 = [egmsroitools.toepsg3035(ROi,segment=0.1) for ROi in self.ROIs]
+
+        if not output == 'None':
+            egmsroitools.exportROI(self.ROIs,output)
+            if self.verbose:
+                print('\tROIs saved in %s.' % (output))
 
     ################################################################################
     ## Function to detect the data regarding the burst IDs
@@ -147,6 +163,102 @@ class S1ROIparameter:
 
         infoburstID = kwargs['infoburstID']
 
+        Track_user, Pass_user = self.checktrackpass(**kwargs)
+
+        if not "cache" in kwargs:
+            usecache = True
+        else:
+            usecache = kwargs['cache']
+
+        warnings.warn('The use of the S1 burst ID map is less accurate than the use of .xml S1 files.')
+        
+        ## Read the shapefile
+        listROI = self.readROI()
+
+        results = self.searchROIs({'ROI': listROI},infoburstID,Track_user,Pass_user,usecache)
+        Data, DataL3 = results['ROI']
+
+        ## Add the results to the previous searches (L2a/L2b) or replace them (L3)
+        self.Data.append(Data)
+        if self.egmslevel == 'L3':
+            self.DataL3 = DataL3
+
+    ################################################################################
+    ## Function to detect the data regarding the burst IDs for several ROIs (one search)
+    ################################################################################
+    def detectfromIDmapbatch(self,**kwargs):
+
+        self.checkparameter()
+
+        if self.verbose:
+            print('EMGStoolkit.py => EGMSS1ROIapi: detect the data regarding the burst IDs for several ROIs')
+
+        infoburstID = kwargs['infoburstID']
+
+        # ROIs: dict (ID => bbox, vector file, country or shapely geometry in EPSG:4326) or list
+        ROIs = kwargs['ROIs']
+        if not isinstance(ROIs, dict):
+            ROIs = dict(zip(range(1,len(ROIs)+1),ROIs))
+
+        Track_user, Pass_user = self.checktrackpass(**kwargs)
+
+        if not "cache" in kwargs:
+            usecache = True
+        else:
+            usecache = kwargs['cache']
+
+        warnings.warn('The use of the S1 burst ID map is less accurate than the use of .xml S1 files.')
+
+        ## Polygons of each ROI
+        dictROI = dict()
+        listROI = []
+        listROIepsg3035 = []
+        verbose = self.verbose
+        self.verbose = False
+        for idROI in ROIs:
+            if isinstance(ROIs[idROI], BaseGeometry):
+                dictROI[idROI] = egmsroitools.geometrytopolygons(ROIs[idROI])
+                listROIepsg3035 = listROIepsg3035 + [egmsroitools.toepsg3035(ROi,segment=0.1) for ROi in dictROI[idROI]]
+            else:
+                self.bbox = ROIs[idROI]
+                self.createROI()
+                dictROI[idROI] = self.readROI()
+                listROIepsg3035 = listROIepsg3035 + self.ROIsepsg3035
+            listROI = listROI + dictROI[idROI]
+        self.verbose = verbose
+
+        # All the polygons are kept (e.g., for the map and the clipping)
+        self.ROIs = listROI
+        self.ROIsepsg3035 = listROIepsg3035
+
+        if self.verbose:
+            print('\t%d ROI(s) with %d polygon(s)' % (len(dictROI),sum([len(dictROI[idROI]) for idROI in dictROI])))
+
+        results = self.searchROIs(dictROI,infoburstID,Track_user,Pass_user,usecache)
+
+        ## Union of the results (for the download)
+        DataL3union = {'Tileinfo': [], 'polyL3': [], 'polyL3ll': []}
+        listtile = set()
+        for idROI in results:
+            Data, DataL3 = results[idROI]
+            self.Data.append(Data)
+            for (ti, polyi, polyllli) in zip(DataL3.get('Tileinfo',[]),DataL3.get('polyL3',[]),DataL3.get('polyL3ll',[])):
+                if not polyi.exterior.coords[0] in listtile:
+                    listtile.add(polyi.exterior.coords[0])
+                    DataL3union['Tileinfo'].append(ti)
+                    DataL3union['polyL3'].append(polyi)
+                    DataL3union['polyL3ll'].append(polyllli)
+            results[idROI] = {'Data': Data, 'DataL3': DataL3}
+        if self.egmslevel == 'L3':
+            self.DataL3 = DataL3union
+
+        return results
+
+    ################################################################################
+    ## Function to check the track/pass parameters
+    ################################################################################
+    def checktrackpass(self,**kwargs):
+
         if not "Track" in kwargs:
             Track_user = 'None'
         else: 
@@ -155,132 +267,204 @@ class S1ROIparameter:
             Pass_user = 'None'
         else:
             Pass_user = kwargs['Pass']
-            for pii in Pass_user:
-                if not (pii.upper() == 'ASCENDING' or pii.upper() == 'DESCENDING' or pii == 'None'): 
-                    sys.exit('Error: pass should be Ascending or Descending.')
 
-        if (isinstance(Track_user, list) and isinstance(Pass_user, list)): 
-            if not len(Track_user) == len(Pass_user):
-                sys.exit('Error: The track and pass parameters do not have the same length.')
+        if not isinstance(Track_user, list):
+            Track_user = [Track_user]
+        if not isinstance(Pass_user, list):
+            Pass_user = [Pass_user]
+
+        for pii in Pass_user:
+            if not (pii.upper() == 'ASCENDING' or pii.upper() == 'DESCENDING' or pii == 'None'): 
+                sys.exit('Error: pass should be Ascending or Descending.')
+
+        ## Same pass for all the tracks
+        if len(Pass_user) == 1:
+            Pass_user = Pass_user*len(Track_user)
+        elif len(Track_user) == 1:
+            Track_user = Track_user*len(Pass_user)
+
+        if not len(Track_user) == len(Pass_user):
+            sys.exit('Error: The track and pass parameters do not have the same length.')
+
+        ## Normalised once: track number or 'None', ASCENDING/DESCENDING or 'None'
+        Track_user = ['None' if str(ti) == 'None' else int(ti) for ti in Track_user]
+        Pass_user = ['None' if pi == 'None' else pi.upper() for pi in Pass_user]
+
+        return Track_user, Pass_user
+
+    ################################################################################
+    ## Function to get the polygons of the ROIs (in memory, or from a vector file given by the user)
+    ################################################################################
+    def readROI(self):
+
+        if isinstance(self.ROIs, str):
+            self.ROIs = egmsroitools.readROIfile(self.ROIs)
+            self.ROIsepsg3035 = [egmsroitools.toepsg3035(ROi,segment=0.1) for ROi in self.ROIs]
+
+        return list(self.ROIs)
+
+    ################################################################################
+    ## Function to get the polygons in EPSG:3035 (cached for the ROIs of the class)
+    ################################################################################
+    def getROIsepsg3035(self,listROI):
 
-        warnings.warn('The use of the S1 burst ID map is less accurate than the use of .xml S1 files.')
-        
-        ## Read the shapefile
-        listROI = []
         listROIepsg3035 = []
-        with fiona.open(self.ROIs) as shpfile:
-            for feature in shpfile:
-                coordinates = []
-                Xcoord = []
-                Ycoord = []
-                line = shape(feature['geometry'])
-                if isinstance(line, LineString):
-                    for index, point in enumerate(line.coords):
-                        if index == 0:
-                            first_pt = point
-                        coordinates.append(point)
-                        X, Y = latlon_to_meter.transform(point[1],point[0])
-                        Xcoord.append(X)
-                        Ycoord.append(Y)
-                if len(coordinates) >= 3:
-                    listROI.append(Polygon(coordinates))
-                    listROIepsg3035.append(Polygon(list(zip(Xcoord, Ycoord))))
+        for ROi in listROI:
+            idx = [i1 for (i1, ri) in enumerate(self.ROIs) if ri is ROi]
+            if idx and len(self.ROIsepsg3035) == len(self.ROIs):
+                listROIepsg3035.append(self.ROIsepsg3035[idx[0]])
+            else:
+                listROIepsg3035.append(egmsroitools.toepsg3035(ROi,segment=0.1))
+
+        return listROIepsg3035
+
+    ################################################################################
+    ## Function to get the results of the ROIs (from the cache or from one search)
+    ################################################################################
+    def searchROIs(self,dictROI,infoburstID,Track_user,Pass_user,usecache=True):
+
+        ## Search results already in the cache (same ROIs, level, tracks/passes and S1 burst ID map)
+        querycache = None
+        if usecache and (not infoburstID is None):
+            querycache = egmsquerycache.openquerycache(infoburstID.dirmap)
+            if (not querycache is None) and (not infoburstID.pathIDmap == 'None'):
+                querycache.invalidate(infoburstID.pathIDmap)
+
+        results = dict()
+        keyquery = dict()
+        for idROI in dictROI:
+            if self.egmslevel == 'L3':
+                keyquery[idROI] = egmsquerycache.makekey(dictROI[idROI],'L3','None','None','None')
+            else:
+                keyquery[idROI] = egmsquerycache.makekey(dictROI[idROI],'L2',Track_user,Pass_user,infoburstID.pathIDmap)
+            if not querycache is None:
+                resulti = querycache.get(keyquery[idROI])
+                if not resulti is None:
+                    results[idROI] = resulti
+
+        if results and self.verbose:
+            print('\tSearch results of %d ROI(s) loaded from the cache: %s' % (len(results),querycache.cachedir))
+
+        ## One search for the other ROIs
+        dictmissing = dict([(idROI, dictROI[idROI]) for idROI in dictROI if not idROI in results])
+        if dictmissing:
+            resultsmissing = self.searchfromIDmap(dictmissing,infoburstID,Track_user,Pass_user)
+            for idROI in resultsmissing:
+                results[idROI] = resultsmissing[idROI]
+                if not querycache is None:
+                    if self.egmslevel == 'L3':
+                        querycache.put(keyquery[idROI],'None',*results[idROI])
+                    else:
+                        querycache.put(keyquery[idROI],infoburstID.pathIDmap,*results[idROI])
+
+        if not querycache is None:
+            querycache.close()
+
+        return results
+
+    ################################################################################
+    ## Function to search the bursts/tiles intersecting the ROIs (ID of the ROI => polygons)
+    ################################################################################
+    def searchfromIDmap(self,dictROI,infoburstID,Track_user,Pass_user):
+
+        results = dict()
+        for idROI in dictROI:
+            results[idROI] = (egmsbursttable.egmsbursttable(), dict())
 
         if self.egmslevel == 'L2a' or self.egmslevel == 'L2b':
             if self.verbose:
                 print('\tFor the L2a and L2b levels')
 
-            ## Read the kml files to detect the burst ID
-            filesqlite = glob.glob('%s/IW/sqlite/*.sqlite3' % (infoburstID.pathIDmap))[-1]
-            
-            fiona.supported_drivers["SQLite"] = "r"
-            h = 1
-            with fiona.open(filesqlite) as shpfile:
-                with alive_bar(len(shpfile)) as bar:
-                    for feature in shpfile:
-                        coordinates = []
-                        polyburst = Polygon(feature['geometry']["coordinates"][0][0])
-
-                        test_intersection = False
-                        for ROi in listROI:
-                            test_intersection = ROi.intersects(polyburst)
-                            if test_intersection:
-                                
-                                relative_orbit_number = feature['properties']['relative_orbit_number']
-                                subswath_name = feature['properties']['subswath_name']
-                                orbit_pass = feature['properties']['orbit_pass']
-                                esa_burst_id = feature['properties']['burst_id']
-                                
-                                anx_time = feature['properties']['time_from_anx_sec']
-                                az_size = 1508
-                                dt_az = 0.0020555563
-                                anx_mid = anx_time + az_size/2*dt_az
-
-                                egms_burst_id = esa2egmsburstID.get_egms_burst_cycle_id(relative_orbit_number, anx_mid)[-1]
-                                
-                                if not (isinstance(Track_user, list)):
-                                    Track_user = [Track_user]
-                                if not isinstance(Pass_user, list):
-                                    Pass_user = [Pass_user]
-
-                                if (isinstance(Track_user,list) and isinstance(Pass_user,list) and len(Pass_user)==1):
-                                    Pass_usertmp = np.tile(Pass_user[0], [len(Track_user),1])
-                                    Pass_user = []
-                                    for i1 in Pass_usertmp:
-                                        Pass_user.append(i1[0])
-
-                                for (tracki, passi) in zip(Track_user, Pass_user):
-                                    
-                                    if (tracki == relative_orbit_number or str(tracki) == 'None') and (passi.upper() == orbit_pass or passi == 'None'):
-                                        if not "%s_%04d" % (orbit_pass,relative_orbit_number) in self.Data:
-                                            self.Data["%s_%04d" % (orbit_pass,relative_orbit_number)] = {'IW1': [], 
-                                                                                                            'IW2': [],
-                                                                                                            'IW3': []}
-                                            
-                                        self.Data["%s_%04d" % (orbit_pass,relative_orbit_number)][subswath_name].append({'relative_orbit_number': relative_orbit_number, 
-                                                                                                                    'subswath_name': subswath_name, 
-                                                                                                                    'orbit_pass': orbit_pass, 
-                                                                                                                    'esa_burst_id': esa_burst_id, 
-                                                                                                                    'egms_burst_id': egms_burst_id,  
-                                                                                                                    'polyburst': polyburst})
-                        bar()
-        elif self.egmslevel == 'L3':
+            ## Detect the burst IDs with the spatial index of the map (loaded once): all the polygons in one query
+            listROI = []
+            listposROI = []
+            for (posROI, idROI) in enumerate(dictROI):
+                listROI = listROI + dictROI[idROI]
+                listposROI = listposROI + [posROI]*len(dictROI[idROI])
+
+            burstindex = egmsburstindex.getburstindex(infoburstID.pathIDmap,verbose=self.verbose)
+
+            ## Selection of the tracks/passes on the attribute columns, before any geometry test
+            idxselect = burstindex.selecttrackpass(Track_user,Pass_user)
+            if self.verbose and (not idxselect is None):
+                print('\t%d burst(s) on the selected track(s)/pass(es) among %d' % (len(idxselect),len(burstindex)))
+
+            idxROI, idxburst = burstindex.querybatch(listROI,idxselect=idxselect)
+
             if self.verbose:
-                print('\tFor the L3 level: the input argument will be ignored.')
+                print('\t%d burst(s) intersecting the ROI(s)' % (len(np.unique(idxburst))))
 
-            self.DataL3['Tileinfo'] = []
-            self.DataL3['polyL3'] = []
-            self.DataL3['polyL3ll'] = []
+            ## Bursts of each ROI
+            listposROI = np.array(listposROI,dtype=int)
+            for (posROI, idROI) in enumerate(dictROI):
+                test_ROI = (listposROI[idxROI] == posROI)
+                results[idROI] = (egmsbursttable.fromindex(burstindex,np.unique(idxburst[test_ROI])), dict())
 
-            ## Bound of the EPSG:3035
-            # xlimGRID = [1896628.62, 7104179.2]
-            # ylimGRID = [1095703.18, 6882401.15]
+        elif self.egmslevel == 'L3':
+            if self.verbose:
+                print('\tFor the L3 level: the input argument will be ignored.')
 
-            xlimGRID = [900000, 7400000]
-            ylimGRID = [900000, 7400000]
+            for idROI in dictROI:
+                results[idROI] = (egmsbursttable.egmsbursttable(), self.searchL3(dictROI[idROI]))
 
-            offset = 5
-            xGRID = np.arange(np.floor(xlimGRID[0]/100000)-offset,np.floor(xlimGRID[1]/100000)+offset,1)
-            yGRID = np.arange(np.floor(ylimGRID[0]/100000)-offset,np.floor(ylimGRID[1]/100000)+offset,1)
+        return results
 
-            for xi in xGRID:
-                for yi in yGRID: 
-                    xseg = [xi*100000, (xi+1)*100000, (xi+1)*100000, xi*100000, xi*100000]
-                    yseg = [yi*100000, yi*100000, (yi+1)*100000, (yi+1)*100000, yi*100000]
+    ################################################################################
+    ## Function to search the L3 tiles intersecting the polygons of a ROI
+    ################################################################################
+    def searchL3(self,listROI):
+
+        DataL3 = dict()
+        DataL3['Tileinfo'] = []
+        DataL3['polyL3'] = []
+        DataL3['polyL3ll'] = []
+
+        ## Bound of the EPSG:3035
+        # xlimGRID = [1896628.62, 7104179.2]
+        # ylimGRID = [1095703.18, 6882401.15]
+
+        xlimGRID = [900000, 7400000]
+        ylimGRID = [900000, 7400000]
+
+        offset = 5
+        xGRID = np.arange(np.floor(xlimGRID[0]/100000)-offset,np.floor(xlimGRID[1]/100000)+offset,1)
+        yGRID = np.arange(np.floor(ylimGRID[0]/100000)-offset,np.floor(ylimGRID[1]/100000)+offset,1)
+
+        ## Candidate cells from the bounds of the ROIs in EPSG:3035 (padded by one cell)
+        listcell = set()
+        for ROi in self.getROIsepsg3035(listROI):
+            coordROI = shapely.get_coordinates(ROi)
+            xmin, ymin, xmax, ymax = np.nanmin(coordROI[:,0]), np.nanmin(coordROI[:,1]), np.nanmax(coordROI[:,0]), np.nanmax(coordROI[:,1])
+            for xi in xGRID[(xGRID >= np.floor(xmin/100000)-1) & (xGRID <= np.floor(xmax/100000)+1)]:
+                for yi in yGRID[(yGRID >= np.floor(ymin/100000)-1) & (yGRID <= np.floor(ymax/100000)+1)]:
+                    listcell.add((xi, yi))
+        listcell = sorted(listcell)
+
+        if listcell:
+            ## Corners of the candidate cells: one transform for all the cells
+            xcell = np.array([ci[0] for ci in listcell])
+            ycell = np.array([ci[1] for ci in listcell])
+            xseg = (np.stack([xcell, xcell+1, xcell+1, xcell, xcell],axis=1)*100000).astype(float)
+            yseg = (np.stack([ycell, ycell, ycell+1, ycell+1, ycell],axis=1)*100000).astype(float)
+
+            lat, lon = meter_to_latlon.transform(xseg.ravel(),yseg.ravel())
+            lat = np.reshape(lat,xseg.shape)
+            lon = np.reshape(lon,xseg.shape)
+
+            ## Exact test on the candidate cells only
+            polyL3llcell = shapely.polygons(np.stack([lon, lat],axis=2))
+            testcell = np.zeros(len(listcell),dtype=bool)
+            for ROi in listROI:
+                shapely.prepare(ROi)
+                testcell = testcell | shapely.intersects(ROi,polyL3llcell)
+
+            for idx in np.nonzero(testcell)[0]:
+                DataL3['Tileinfo'].append('Tile L3')
+                DataL3['polyL3'].append(Polygon(list(zip(xseg[idx], yseg[idx]))))
+                DataL3['polyL3ll'].append(polyL3llcell[idx])
+
+        return DataL3
 
-                    lat, lon = meter_to_latlon.transform(xseg,yseg)
-                    
-                    polyL3 = Polygon(list(zip(xseg, yseg)))
-                    polyL3ll = Polygon(list(zip(lon, lat)))
-
-                    test_intersection = False
-                    for ROi in listROI:
-                        test_intersection = ROi.intersects(polyL3ll)
-                        if test_intersection:
-                            self.DataL3['Tileinfo'].append('Tile L3')
-                            self.DataL3['polyL3'].append(polyL3)
-                            self.DataL3['polyL3ll'].append(polyL3ll)
-                    
     ################################################################################
     ## Save the results into a file
     ################################################################################
@@ -289,14 +473,13 @@ class S1ROIparameter:
         self.checkparameter()
 
         if self.verbose:
-            print('EMGStoolkit.py => EGMSS1ROIapi: save the L2a/L2b search results into a file')
+            print('EMGStoolkit.py => EGMSS1ROIapi: save the search results into a file')
 
         if not "output" in kwargs:
-            output = 'egmslist.pkl'
+            output = 'egmslist.bin'
         else: 
             output = kwargs['output']
-        with open(output, 'wb') as fp:
-            pickle.dump(self.Data, fp)
+        egmsquerycache.savedata(output,self.Data,self.DataL3)
 
         if self.verbose:
             print('\tFile %s created.' % (output))
@@ -309,14 +492,18 @@ class S1ROIparameter:
         self.checkparameter()
 
         if self.verbose:
-            print('EMGStoolkit.py => EGMSS1ROIapi: load the L2a/L2b search results from a file')
+            print('EMGStoolkit.py => EGMSS1ROIapi: load the search results from a file')
 
         if not "input" in kwargs:
-            input = 'egmslist.pkl'
+            input = 'egmslist.bin'
+            # File of the previous versions (pickle)
+            if (not os.path.isfile(input)) and os.path.isfile('egmslist.pkl'):
+                input = 'egmslist.pkl'
         else: 
             input = kwargs['input']
-        with open(input, 'rb') as fp:
-            self.Data = pickle.load(fp)
+        self.Data, DataL3 = egmsquerycache.loaddata(input)
+        if DataL3:
+            self.DataL3 = DataL3
         
         if self.verbose:
             print('\tFile %s loaded.' % (input))
@@ -346,11 +533,7 @@ class S1ROIparameter:
         latall = []
 
         # Compute the color
-        listtrack = []
-        for tracki in self.Data:
-            listtrack.append(tracki)
-
-        listtrackunique = np.unique(listtrack)
+        listtrackunique = self.Data.tracks()
         listcolor = []
         for li in listtrackunique:
             a = np.random.randint(255, size=3)
@@ -358,23 +541,24 @@ class S1ROIparameter:
         
         # Plot the bursts
         if self.Data:
-            for tracki in self.Data:
+            listtrack = self.Data.tracknames()
+            listsubswath = self.Data.subswathnames()
+            listgeometry = self.Data.geometries()
+            for (tracki, iwi, polyburst, egms_burst_id) in zip(listtrack, listsubswath, listgeometry, self.Data.table['egms_burst_id']):
                 
-                ni = np.where(tracki == listtrackunique)[0][0]
-
-                for idx in ['1','2','3']: 
-                    for iwi in self.Data[tracki]['IW%s' %(idx)]:
-                        lonall = lonall + iwi['polyburst'].exterior.coords.xy[0].tolist()
-                        latall = latall + iwi['polyburst'].exterior.coords.xy[1].tolist()
-
-                        fig.add_trace(go.Scattermapbox(
-                            mode = "lines",
-                            showlegend = False,
-                            line=dict(color=listcolor[ni]), 
-                            lon = iwi['polyburst'].exterior.coords.xy[0].tolist(),
-                            lat = iwi['polyburst'].exterior.coords.xy[1].tolist(), 
-                            hovertemplate='%s IW%s' % (tracki,idx), 
-                            name='ID %d' % (iwi['egms_burst_id'])))
+                ni = listtrackunique.index(tracki)
+
+                lonall = lonall + polyburst.exterior.coords.xy[0].tolist()
+                latall = latall + polyburst.exterior.coords.xy[1].tolist()
+
+                fig.add_trace(go.Scattermapbox(
+                    mode = "lines",
+                    showlegend = False,
+                    line=dict(color=listcolor[ni]), 
+                    lon = polyburst.exterior.coords.xy[0].tolist(),
+                    lat = polyburst.exterior.coords.xy[1].tolist(), 
+                    hovertemplate='%s %s' % (tracki,iwi), 
+                    name='ID %d' % (egms_burst_id)))
         
         try:
             for tilei in self.DataL3['polyL3ll']:
@@ -393,18 +577,7 @@ class S1ROIparameter:
         except:
             a = 'dummy'
                     
-        listROI = []            
-        with fiona.open(self.ROIs) as shpfile:
-            for feature in shpfile:
-                coordinates = []
-                line = shape(feature['geometry'])
-                if isinstance(line, LineString):
-                    for index, point in enumerate(line.coords):
-                        if index == 0:
-                            first_pt = point
-                        coordinates.append(point)
-                if len(coordinates) >= 3:
-                    listROI.append(Polygon(coordinates))
+        listROI = self.readROI()
 
         for polyi in listROI:
             fig.add_trace(go.Scattermapbox(
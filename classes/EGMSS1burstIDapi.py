@@ -5,11 +5,25 @@
 
 import datetime 
 import os 
+import re
 import sys
-import wget
 import zipfile
-import urllib.request  
+import urllib.error
+import http.client
 import warnings
+import concurrent.futures
+
+from functions import egmshttptools
+from functions import egmsburstindex
+
+## Name of the file storing the latest known version of the map (in the directory of the maps)
+namelatest = 'S1_burstid_latest.txt'
+
+## Number of dates probed at the same time
+nbprobe = 16
+
+## Number of days checked again before the last check (the maps can be published after their date)
+nbdaymargin = 30
 
 ################################################################################
 ## Creation of a class to manage the Sentinel-1 burst ID map
@@ -23,7 +37,8 @@ class S1burstIDmap:
         self.date_str_init = '29/05/2022'
         self.dirmap = os.environ.get('PATHS1BURSTIDMAP')+'/'
         self.pathIDmap = 'None'
-        self.list_date = []
+        self.list_version = []
+        self.urlmap = os.environ.get('EGMSBURSTIDURL','https://sar-mpc.eu/files')
         self.verbose = True 
 
         self.verbose = False
@@ -45,70 +60,164 @@ class S1burstIDmap:
         if self.verbose:
             print('EMGStoolkit.py => S1burstIDmap: check the avaibility of the stored S1 burst ID maps')
 
-        ## Create the list of dates
-        self.list_date = []; 
-        datei = datetime.datetime.strptime(self.date_str_init, '%d/%m/%Y')
+        ## One scan of the directory: versions of the maps (dates)
+        self.list_version = []
+        if os.path.isdir(self.dirmap):
+            with os.scandir(self.dirmap) as listentry:
+                for entry in listentry:
+                    match = re.fullmatch(r'S1_burstid_(\d{8})',entry.name)
+                    if match and entry.is_dir():
+                        self.list_version.append(match.group(1))
+        self.list_version.sort()
 
-        while datei <=  datetime.datetime.now(): 
-            datei = datei + datetime.timedelta(days=1)
-            self.list_date.append(datei.strftime("%Y%m%d"))
+        if self.list_version:
+            self.pathIDmap = "%s/S1_burstid_%s" %(self.dirmap,self.list_version[-1])
 
-        ## Check if the directory exists
-        for i1 in self.list_date:
-            if os.path.isdir("%s/S1_burstid_%s" %(self.dirmap,i1)):
-                self.pathIDmap = "%s/S1_burstid_%s" %(self.dirmap,i1)
-
-                if self.verbose:
-                    print('\tDetection of the directory: %s' % (self.pathIDmap))
+            if self.verbose:
+                print('\tDetection of the directory: %s' % (self.pathIDmap))
+        else:
+            self.pathIDmap = 'None'
 
         if self.verbose and self.pathIDmap == 'None':
             warnings.warn('\tNo detection of the directory...\n\tPlease download the .zip file.') 
 
+        ## Build the index of the bursts for a new map (once per version of the map)
+        if not self.pathIDmap == 'None':
+            if egmsburstindex.isoutdated(self.pathIDmap):
+                egmsburstindex.buildburstindex(self.pathIDmap,verbose=self.verbose)
+
     ################################################################################
-    ## Donwload the latest map
+    ## Function to read the latest known version of the map (latest version, date of the check)
     ################################################################################
-    def downloadfile(self): 
+    def readlatest(self):
 
-        if self.verbose:
-            print('EMGStoolkit.py => S1burstIDmap: download the latest S1 burst ID maps')
+        try:
+            with open('%s/%s' % (self.dirmap,namelatest),'r') as fin:
+                latest, checked = fin.read().split()
+        except (OSError, ValueError):
+            return 'None', 'None'
 
-        h = 0
-        while self.pathIDmap == 'None':
-            i1 = self.list_date[h]
-            try:
-                status = urllib.request.urlopen("https://sar-mpc.eu/files/S1_burstid_%s.zip" %(i1)).getcode()
-                self.pathIDmap = "https://sar-mpc.eu/files/S1_burstid_%s.zip" %(i1)
-                if self.verbose:
-                    print("\tCheck the https://sar-mpc.eu/files/S1_burstid_%s.zip link ==> DETECTED" %(i1))
-            except:
-                print("\tCheck the https://sar-mpc.eu/files/S1_burstid_%s.zip link ==> NO DETECTED" %(i1))
-
-            h = h + 1
-            if h == len(self.list_date):
-                sys.exit('ERROR: No detection of S1 burst ID map...')
+        return latest, checked
+
+    ################################################################################
+    ## Function to write the latest known version of the map
+    ################################################################################
+    def writelatest(self,latest,checked):
+
+        if not os.path.isdir(self.dirmap):
+            os.makedirs(self.dirmap)
+        with open('%s/%s.tmp' % (self.dirmap,namelatest),'w') as fout:
+            fout.write('%s %s\n' % (latest,checked))
+        os.replace('%s/%s.tmp' % (self.dirmap,namelatest),'%s/%s' % (self.dirmap,namelatest))
 
+    ################################################################################
+    ## Function to detect the latest remote version after a date ('None' if no detection)
+    ################################################################################
+    def probelatest(self,datestart,session):
+
+        ## Dates to check, from the newest to the oldest
+        list_date = []
+        datei = datetime.date.today()
+        datemin = datetime.datetime.strptime(datestart, '%Y%m%d').date()
+        while datei > datemin:
+            list_date.append(datei.strftime("%Y%m%d"))
+            datei = datei - datetime.timedelta(days=1)
+
+        def probe(datei):
+            urlmap = "%s/S1_burstid_%s.zip" %(self.urlmap,datei)
             try:
-                # Download the file
-                filename = wget.download(self.pathIDmap, out=self.dirmap)
-                print(f"File downloaded: {filename}")
-            except Exception as e:
-                print(f"An error occurred: {e}")
+                session.head(urlmap)
+                return True
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                return False
+
+        ## Several dates at the same time: the first detection is the latest version
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nbprobe) as executor:
+            for i1 in range(0,len(list_date),nbprobe):
+                list_datei = list_date[i1:i1+nbprobe]
+                for datei, detected in zip(list_datei,executor.map(probe,list_datei)):
+                    if detected:
+                        if self.verbose:
+                            print("\tCheck the %s/S1_burstid_%s.zip link ==> DETECTED" %(self.urlmap,datei))
+                        return datei
 
-            if self.verbose:
-                    print("\tUnzip the .zip file %s in %s" %(self.dirmap,i1))
+        if self.verbose:
+            print("\tCheck of %d link(s) after %s ==> NO DETECTED" %(len(list_date),datestart))
 
-            with zipfile.ZipFile("%s/S1_burstid_%s.zip" %(self.dirmap,i1), 'r') as zip_ref:
-                zip_ref.extractall(self.dirmap)
+        return 'None'
 
-            if self.verbose:
-                    print("\tDelete the .zip file %s in %s" %(self.dirmap,i1))    
-            os.remove("%s/S1_burstid_%s.zip" %(self.dirmap,i1))
+    ################################################################################
+    ## Donwload the latest map
+    ################################################################################
+    def downloadfile(self,**kwargs): 
 
-        self.checkfile()
+        if self.verbose:
+            print('EMGStoolkit.py => S1burstIDmap: download the latest S1 burst ID maps')
 
+        if not "update" in kwargs:
+            update = False
+        else: 
+            update = kwargs['update']
+
+        ## A map is already stored: check the remote versions only if asked
+        if (not self.pathIDmap == 'None') and (not update):
+            self.checkfile()
+            return
+
+        session = egmshttptools.get_session()
+
+        ## Start after the latest version known (stored or detected before) 
+        latestknown, checked = self.readlatest()
+        list_start = [datetime.datetime.strptime(self.date_str_init, '%d/%m/%Y').strftime("%Y%m%d")]
+        if self.list_version:
+            list_start.append(self.list_version[-1])
+        if not latestknown == 'None':
+            list_start.append(latestknown)
+        if not checked == 'None':
+            list_start.append((datetime.datetime.strptime(checked, '%Y%m%d') - datetime.timedelta(days=nbdaymargin)).strftime("%Y%m%d"))
+
+        latest = self.probelatest(max(list_start),session)
+        if latest == 'None':
+            latest = latestknown
+        if not latest == 'None':
+            self.writelatest(latest,datetime.datetime.now().strftime("%Y%m%d"))
+
+        if latest == 'None':
+            if self.pathIDmap == 'None':
+                sys.exit('ERROR: No detection of S1 burst ID map...')
+            else:
+                self.checkfile()
+                return
 
+        if self.list_version and latest <= self.list_version[-1]:
+            if self.verbose:
+                print('\tThe stored S1 burst ID map is the latest: %s' % (self.pathIDmap))
+            self.checkfile()
+            return
+
+        i1 = latest
+        urlmap = "%s/S1_burstid_%s.zip" %(self.urlmap,i1)
+        try:
+            # Download the file (with the pooled connection)
+            pathpart, totalsize = egmshttptools.downloadresume(urlmap,"%s/S1_burstid_%s.zip" %(self.dirmap,i1),session=session)
+            os.replace(pathpart,"%s/S1_burstid_%s.zip" %(self.dirmap,i1))
+            print("File downloaded: %s/S1_burstid_%s.zip" %(self.dirmap,i1))
+        except Exception as e:
+            # The latest known version is not valid anymore
+            if os.path.isfile('%s/%s' % (self.dirmap,namelatest)):
+                os.remove('%s/%s' % (self.dirmap,namelatest))
+            sys.exit(f"An error occurred: {e}")
 
+        if self.verbose:
+                print("\tUnzip the .zip file %s in %s" %(self.dirmap,i1))
 
+        with zipfile.ZipFile("%s/S1_burstid_%s.zip" %(self.dirmap,i1), 'r') as zip_ref:
+            zip_ref.extractall(self.dirmap)
 
+        if self.verbose:
+                print("\tDelete the .zip file %s in %s" %(self.dirmap,i1))    
+        os.remove("%s/S1_burstid_%s.zip" %(self.dirmap,i1))
 
+        self.pathIDmap = "%s/S1_burstid_%s" %(self.dirmap,i1)
 
+        self.checkfile()
@@ -5,17 +5,36 @@
 
 import os 
 import sys
-import wget
 import zipfile
 import numpy as np
 import glob
 import warnings
 import shutil
 import time
+import threading
+import concurrent.futures
+import urllib.error
+import http.client
+import tempfile
+import json
 
 from functions import egmsapitools
+from functions import egmshttptools
+from functions import egmsmanifest
+from functions import egmscache
+from functions import egmscatalog
 
-timeerror462 = 15
+maxretry = 8
+spoolsize = 64*1024*1024
+nameunzipmarker = '.egmsunzipped'
+namesizecatalog = 'egmssizecatalog.json'
+
+## Ratios used to estimate the disk space (unzipped/zip and merged/unzipped)
+ratiounzip = 4.0
+ratiomerged = 1.0
+
+## Latency of a request in s (preparation of the file by the portal and connection), used to estimate the download time
+latencyrequest = 5.0
 
 ################################################################################
 ## Creation of a class to manage the Sentinel-1 burst ID map
@@ -26,18 +45,30 @@ class egmsdownloader:
     ## Initialistion of the class
     ################################################################################
     def __init__(self):
-        self.listL2a = []
-        self.listL2alink = []
-        self.listL2b = []
-        self.listL2blink = []
-        self.listL3UD = []
-        self.listL3UDlink = []
-        self.listL3EW = []
-        self.listL3EWlink = []
+        self.catalog = egmscatalog.egmscatalog()
         self.token = 'XXXXXXX--XXXXXXX'
        
         self.verbose = True
 
+    ################################################################################
+    ## Lists of files (kept for the scripts using the former lists)
+    ################################################################################
+    @property
+    def listL2a(self):
+        return self.catalog.values('name',type='L2a')
+
+    @property
+    def listL2b(self):
+        return self.catalog.values('name',type='L2b')
+
+    @property
+    def listL3UD(self):
+        return self.catalog.values('name',type='L3UD')
+
+    @property
+    def listL3EW(self):
+        return self.catalog.values('name',type='L3EW')
+
     ################################################################################
     ## Check parameters
     ################################################################################
@@ -71,17 +102,12 @@ class egmsdownloader:
         
         if infoS1ROIparameter.Data: 
             if infoS1ROIparameter.egmslevel == 'L2a' or infoS1ROIparameter.egmslevel == 'L2b': 
-                for tracki in infoS1ROIparameter.Data:
-                    for idx in ['1','2','3']: 
-                        for iwi in infoS1ROIparameter.Data[tracki]['IW%s' %(idx)]:
-                            name_zip = 'EGMS_%s_%03d_%04d_IW%s_VV%s.zip' % (infoS1ROIparameter.egmslevel,iwi['relative_orbit_number'],iwi['egms_burst_id'],idx,release_para[1])
-                            link_zip = 'https://egms.land.copernicus.eu/insar-api/archive/download/%s' % (name_zip)
-                            if infoS1ROIparameter.egmslevel == 'L2a':
-                                self.listL2a.append(name_zip)
-                                self.listL2alink.append(link_zip)
-                            elif infoS1ROIparameter.egmslevel == 'L2b':
-                                self.listL2b.append(name_zip)
-                                self.listL2blink.append(link_zip)
+                Data = infoS1ROIparameter.Data
+                for (tracki, bursti, iwi) in zip(Data.table['relative_orbit_number'].tolist(), Data.table['egms_burst_id'].tolist(), Data.subswathnames()):
+                    name_zip = 'EGMS_%s_%03d_%04d_%s_VV%s.zip' % (infoS1ROIparameter.egmslevel,tracki,bursti,iwi,release_para[1])
+                    link_zip = 'https://egms.land.copernicus.eu/insar-api/archive/download/%s' % (name_zip)
+                    self.catalog.add(name_zip,infoS1ROIparameter.egmslevel,infoS1ROIparameter.egmslevel,release_para[0],link_zip,
+                                     track=tracki,burst=bursti,component=str(iwi))
 
         if infoS1ROIparameter.DataL3:
             if infoS1ROIparameter.egmslevel == 'L3':
@@ -93,21 +119,8 @@ class egmsdownloader:
                     name_zip = 'EGMS_L3_E%2dN%2d_100km_%s%s.zip' % (y,x,ext_3D,release_para[1])
                     link_zip = 'https://egms.land.copernicus.eu/insar-api/archive/download/%s' % (name_zip)
 
-                    if infoS1ROIparameter.egmsL3component == 'UD':
-                        self.listL3UD.append(name_zip)
-                        self.listL3UDlink.append(link_zip)
-                    elif infoS1ROIparameter.egmsL3component == 'EW':
-                        self.listL3EW.append(name_zip)
-                        self.listL3EWlink.append(link_zip)
-
-        self.listL2a = np.unique(self.listL2a).tolist()
-        self.listL2alink = np.unique(self.listL2alink).tolist()
-        self.listL2b = np.unique(self.listL2b).tolist()
-        self.listL2blink = np.unique(self.listL2blink).tolist()
-        self.listL3UD = np.unique(self.listL3UD).tolist()
-        self.listL3UDlink = np.unique(self.listL3UDlink).tolist()
-        self.listL3EW = np.unique(self.listL3EW).tolist()
-        self.listL3EWlink = np.unique(self.listL3EWlink).tolist()
+                    self.catalog.add(name_zip,'L3','L3%s' % (infoS1ROIparameter.egmsL3component),release_para[0],link_zip,
+                                     burst='E%2dN%2d' % (y,x),component=infoS1ROIparameter.egmsL3component)
 
         if self.verbose:
             print('\tPrint the list using the printlist method')
@@ -121,16 +134,152 @@ class egmsdownloader:
         if self.verbose:
             print('EMGStoolkit.py => EGMSdownloaderapi: print the list(s) of files')
 
-        for type in ['L2a', 'L2b', 'L3UD', 'L3EW']:
-            datatmp = eval('self.list%s' % (type))
-            datatmplink = eval('self.list%slink' % (type))
+        for type in egmscatalog.listtype:
+            datatmp = self.catalog.rows(type=type)
         
             if datatmp: 
                 print('For the EGMS data: %s' % (type))
                 for idx in np.arange(len(datatmp)): 
-                    release_para = egmsapitools.check_release_fromfile(datatmp[idx])
-                    # print('\t File %d: %s stored to %s (Release %s)' % (idx+1,datatmp[idx],datatmplink[idx],release_para[0]))
-                    print('\t File %d: %s (Release %s)' % (idx+1,datatmp[idx],release_para[0]))
+                    # print('\t File %d: %s stored to %s (Release %s)' % (idx+1,datatmp[idx]['name'],datatmp[idx]['link'],datatmp[idx]['release']))
+                    print('\t File %d: %s (Release %s)' % (idx+1,datatmp[idx]['name'],datatmp[idx]['release']))
+
+    ################################################################################
+    ## Function to plan the download (dry run): volume, disk space and time
+    ################################################################################
+    def plan(self,**kwargs): 
+
+        self.checkparameter()
+
+        if self.verbose:
+            print('EMGStoolkit.py => EGMSdownloaderapi: plan the download (dry run)')
+
+        if not "outputdir" in kwargs:
+            outputdir = './Output'
+        else: 
+            outputdir = kwargs['outputdir']
+
+        if not "nbworkers" in kwargs:
+            nbworkers = 4
+        else: 
+            nbworkers = int(kwargs['nbworkers'])
+
+        if not "ratelimit" in kwargs:
+            ratelimit = 1.0
+        else: 
+            ratelimit = float(kwargs['ratelimit'])
+
+        if not "bandwidth" in kwargs:
+            bandwidth = 10.0
+        else: 
+            bandwidth = float(kwargs['bandwidth'])
+
+        if not "streaming" in kwargs:
+            streaming = False
+        else: 
+            streaming = kwargs['streaming']
+
+        if not "catalog" in kwargs:
+            catalog = '%s/%s' % (outputdir,namesizecatalog)
+        else: 
+            catalog = kwargs['catalog']
+
+        ## Sizes already known: size catalog and manifest of the output directory
+        sizecatalog = dict()
+        if os.path.isfile(catalog):
+            with open(catalog) as fcatalog:
+                sizecatalog = json.load(fcatalog)
+        manifest = egmsmanifest.openmanifest(outputdir,create=False)
+
+        listjob = []
+        for rowi in self.catalog.rows(sortby=['type','name']):
+            listjob.append([rowi['type'],rowi['name'],rowi['link']])
+
+        ## Ask the server for the missing sizes (HEAD requests, with the rate limiter)
+        ratelimiter = egmshttptools.egmsratelimiter(rate=ratelimit,burst=nbworkers)
+        def getsize(namefile,linkfile):
+            if namefile in sizecatalog:
+                return sizecatalog[namefile]
+            if manifest and manifest.tiles.get(namefile.split('.')[0],{}).get('size'):
+                return manifest.tiles[namefile.split('.')[0]]['size']
+            ratelimiter.acquire(linkfile)
+            try:
+                return egmshttptools.remotesize('%s?id=%s' % (linkfile,self.token))
+            except Exception as e:
+                print('\tError for the size of %s: %s' % (namefile,e))
+                return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nbworkers) as executor:
+            listsize = list(executor.map(lambda job: getsize(job[1],job[2]),listjob))
+
+        ## Summary per level and release
+        listplan = dict()
+        for (type, namefile, linkfile), sizei in zip(listjob,listsize):
+            if not sizei is None:
+                sizecatalog[namefile] = sizei
+            release_para = egmsapitools.check_release_fromfile(namefile)
+            key = '%s (%s)' % (type,release_para[0])
+            if not key in listplan:
+                listplan[key] = {'nbfiles': 0, 'nbdone': 0, 'nbunknown': 0, 'sizezip': 0, 'sizetodownload': 0}
+            listplan[key]['nbfiles'] = listplan[key]['nbfiles'] + 1
+            if sizei is None:
+                listplan[key]['nbunknown'] = listplan[key]['nbunknown'] + 1
+                continue
+            listplan[key]['sizezip'] = listplan[key]['sizezip'] + sizei
+            if manifest and manifest.isdone(namefile,'verified'):
+                listplan[key]['nbdone'] = listplan[key]['nbdone'] + 1
+            else:
+                listplan[key]['sizetodownload'] = listplan[key]['sizetodownload'] + sizei
+
+        if manifest:
+            manifest.close()
+
+        if not os.path.isdir(os.path.dirname(os.path.abspath(catalog))):
+            os.makedirs(os.path.dirname(os.path.abspath(catalog)))
+        with open(catalog,'w') as fcatalog:
+            json.dump(sizecatalog,fcatalog)
+
+        nbfiles = sum([listplan[ki]['nbfiles'] for ki in listplan])
+        nbtodownload = sum([listplan[ki]['nbfiles'] - listplan[ki]['nbdone'] for ki in listplan])
+        sizezip = sum([listplan[ki]['sizezip'] for ki in listplan])
+        sizetodownload = sum([listplan[ki]['sizetodownload'] for ki in listplan])
+
+        # Disk space: .zip files, unzipped files and merged files (estimated with the compression ratio)
+        sizeunzip = sizezip * ratiounzip
+        sizemerged = sizeunzip * ratiomerged
+        if streaming:
+            sizedisk = sizeunzip + sizemerged
+        else:
+            sizedisk = sizezip + sizeunzip + sizemerged
+
+        # Time: limited by the bandwidth, by the rate of the requests or by the workers
+        # (each worker waits for the latency of its requests, the bandwidth is shared)
+        timedownload = max(sizetodownload / (bandwidth*1e6),
+                           nbtodownload / ratelimit,
+                           (nbtodownload*latencyrequest + sizetodownload / (bandwidth*1e6)) / nbworkers)
+
+        if os.path.isdir(outputdir):
+            sizefree = shutil.disk_usage(outputdir).free
+        else:
+            sizefree = shutil.disk_usage(os.path.dirname(os.path.abspath(outputdir))).free
+
+        for ki in listplan:
+            print('For the EGMS data: %s' % (ki))
+            print('\t%d file(s), %d already downloaded, %d of unknown size' % (listplan[ki]['nbfiles'],listplan[ki]['nbdone'],listplan[ki]['nbunknown']))
+            print('\t.zip files: %.2f GB (%.2f GB to download)' % (listplan[ki]['sizezip']/1e9,listplan[ki]['sizetodownload']/1e9))
+        print('Total: %d file(s), %.2f GB to download' % (nbfiles,sizetodownload/1e9))
+        print('\tDisk space (estimation): %.2f GB (.zip: %.2f GB, unzipped: %.2f GB, merged: %.2f GB)' % (sizedisk/1e9,0 if streaming else sizezip/1e9,sizeunzip/1e9,sizemerged/1e9))
+        print('\tFree space in the output directory: %.2f GB' % (sizefree/1e9))
+        print('\tDownload time (estimation with %d worker(s), %.1f MB/s, %.2f request(s) per s and %.1f s of latency per request): %.1f h' % (nbworkers,bandwidth,ratelimit,latencyrequest,timedownload/3600))
+        if sizedisk > sizefree:
+            warnings.warn('The output directory does not have enough free space for the planned job.')
+
+        return {'files': listplan,
+                'nbfiles': nbfiles,
+                'sizezip': sizezip,
+                'sizetodownload': sizetodownload,
+                'sizedisk': sizedisk,
+                'sizefree': sizefree,
+                'timedownload': timedownload}
 
     ################################################################################
     ## Function to download the files
@@ -158,56 +307,253 @@ class egmsdownloader:
             cleanmode = kwargs['clean']
 
         if not "force" in kwargs:
-            force = True
+            force = False
         else: 
-            force = kwargs['clean']
+            force = kwargs['force']
+
+        if not "nbworkers" in kwargs:
+            nbworkers = 4
+        else: 
+            nbworkers = int(kwargs['nbworkers'])
+        if nbworkers < 1:
+            sys.exit('Error: the number of workers must be at least 1 (in EGMSdownloaderapi.py)')
+
+        if not "ratelimit" in kwargs:
+            ratelimit = 1.0
+        else: 
+            ratelimit = float(kwargs['ratelimit'])
+        if ratelimit <= 0:
+            sys.exit('Error: the rate limit must be positive (in EGMSdownloaderapi.py)')
+
+        if not "nbunzipworkers" in kwargs:
+            nbunzipworkers = 4
+        else: 
+            nbunzipworkers = int(kwargs['nbunzipworkers'])
+
+        if not "streaming" in kwargs:
+            streaming = False
+        else: 
+            streaming = kwargs['streaming']
+
+        if not "tmpdir" in kwargs:
+            tmpdir = None
+        else: 
+            tmpdir = kwargs['tmpdir']
+
+        if not "cachedir" in kwargs:
+            cachedir = None
+        else: 
+            cachedir = kwargs['cachedir']
+
+        if not "cachesize" in kwargs:
+            cachesize = None
+        else: 
+            cachesize = kwargs['cachesize']
 
         if not os.path.isdir(outputdir): 
             os.mkdir(outputdir)
 
-        total_len = len(self.listL2a) + len(self.listL2b) + len(self.listL3UD) + len(self.listL3EW)
+        ## Open the tile cache shared by the projects (EGMSTILECACHE by default)
+        self.cache = egmscache.opencache(cachedir,cachesize)
+        if self.verbose and self.cache:
+            self.cache.print()
 
-        h = 1
-        for type in ['L2a', 'L2b', 'L3UD', 'L3EW']:
-            datatmp = eval('self.list%s' % (type))
-            datatmplink = eval('self.list%slink' % (type))
-        
-            if datatmp: 
-                if not os.path.isdir('%s/%s' % (outputdir,type)):
-                    os.mkdir('%s/%s' % (outputdir,type))
+        ## Open the manifest of the output directory (state of the tiles from the previous runs)
+        self.manifest = egmsmanifest.openmanifest(outputdir)
 
-                for idx in np.arange(len(datatmp)): 
-                    if self.verbose:
-                        print('%d / %d files: Download the file: %s' % (h,total_len,datatmp[idx]))
-
-                    release_para = egmsapitools.check_release_fromfile(datatmp[idx])
-
-                    if not os.path.isdir('%s/%s/%s' % (outputdir,type,release_para[0])):
-                        os.mkdir('%s/%s/%s' % (outputdir,type,release_para[0]))
-                    pathdir = '%s/%s/%s' % (outputdir,type,release_para[0])
-
-                    if not os.path.isfile('%s/%s' % (pathdir,datatmp[idx])): 
-                        if (not ('%s/%s/%s%s' % (pathdir,datatmp[idx].split('.')[0],datatmp[idx].split('.')[0],'.csv'))) or force == True:
-                            try:
-                                # Download the file
-                                filename = wget.download('%s?id=%s' % (datatmplink[idx],self.token), out=pathdir)
-                                if self.verbose:
-                                    print(f"\tFile downloaded: {filename}")
-                                time.sleep(timeerror462)
-                            except Exception as e:
-                                if self.verbose:
-                                    print(f"An error occurred: {e}")                                    
-                                time.sleep(timeerror462)
-                        else:
-                            if self.verbose:
-                                print('\tAlready downloaded (detection of the .csv file)')
-                    else: 
+        ## Create the list of the files to download
+        listjob = []
+        for rowi in self.catalog.rows(sortby=['type','name']):
+            pathdir = '%s/%s/%s' % (outputdir,rowi['type'],rowi['release'])
+            if not os.path.isdir(pathdir):
+                os.makedirs(pathdir)
+
+            listjob.append([pathdir,rowi['name'],rowi['link']])
+            self.manifest.plan(rowi['name'],rowi['type'],rowi['release'])
+
+        total_len = len(listjob)
+
+        if self.verbose:
+            print('\t%d file(s) to process with %d worker(s)' % (total_len,nbworkers))
+
+        ## Download the files with a bounded pool of workers sharing the same rate limiter
+        self.lockprint = threading.Lock()
+        self.ratelimiter = egmshttptools.egmsratelimiter(rate=ratelimit,burst=nbworkers)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=nbworkers) as executor:
+            listfuture = [executor.submit(self.downloadtile,pathdir,namefile,linkfile,force,nbworkers == 1,streaming,tmpdir) for (pathdir,namefile,linkfile) in listjob]
+
+            h = 1
+            for future in concurrent.futures.as_completed(listfuture):
+                status = future.result()
+                if self.verbose:
+                    with self.lockprint:
+                        print('%d / %d files: %s' % (h,total_len,status))
+                h = h + 1
+
+        if self.verbose:
+            print('\tTime spent throttled: %.1f s (summed over the workers, %d throttling response(s))' % (self.ratelimiter.throttledtime,self.ratelimiter.nbthrottled))
+
+        self.manifest.close()
+        if self.cache:
+            self.cache.close()
+
+        self.unzipfile(outputdir=outputdir,unzip=unzipmode,clean=cleanmode,nbworkers=nbunzipworkers)
+
+    ################################################################################
+    ## Function to download one file (used by the workers)
+    ################################################################################
+    def downloadtile(self,pathdir,namefile,linkfile,force,progressbar,streaming,tmpdir):
+
+        pathfile = '%s/%s' % (pathdir,namefile)
+        pathunzip = '%s/%s' % (pathdir,namefile.split('.')[0])
+
+        if self.manifest.isdone(namefile,'verified') and force == False:
+            # The manifest is trusted only if the files of the tile are still there
+            if os.path.isfile(pathfile) or os.path.isfile('%s/%s%s' % (pathunzip,namefile.split('.')[0],'.csv')) or os.path.isfile('%s/%s' % (pathunzip,nameunzipmarker)):
+                return '%s already downloaded (state in the manifest: %s)' % (namefile,self.manifest.state(namefile))
+            # Files removed by the user: the tile is downloaded again (or taken from the cache)
+            self.manifest.update(namefile,'planned')
+        if os.path.isfile(pathfile) and (not egmsapitools.check_zipfile(pathfile)):
+            # Truncated or corrupted .zip file (e.g., from a previous run): resumed as a .part file
+            if self.verbose:
+                with self.lockprint:
+                    print('\tThe file %s is not a valid .zip file: it will be downloaded again' % (namefile))
+            os.replace(pathfile,'%s.part' % (pathfile))
+            if self.manifest.isdone(namefile,'downloaded'):
+                self.manifest.update(namefile,'planned')
+        if os.path.isfile(pathfile) and force == False: 
+            if not self.manifest.isdone(namefile,'downloaded'):
+                self.manifest.update(namefile,'downloaded',size=os.path.getsize(pathfile))
+            return '%s already downloaded (detection of the .zip file)' % (namefile)
+        if os.path.isfile('%s/%s%s' % (pathunzip,namefile.split('.')[0],'.csv')) and force == False:
+            if not self.manifest.isdone(namefile,'unzipped'):
+                self.manifest.update(namefile,'unzipped')
+            return '%s already downloaded (detection of the .csv file)' % (namefile)
+
+        timestart = time.time()
+
+        # Look for the tile in the cache before using the network
+        if self.cache:
+            if streaming:
+                tile = self.cache.lookup(namefile)
+            else:
+                tile = self.cache.get(namefile,pathfile)
+            if tile:
+                self.manifest.update(namefile,'downloaded',size=tile['size'],duration_download=time.time()-timestart)
+                self.manifest.update(namefile,'verified',checksum=tile['checksum'])
+                if streaming:
+                    with zipfile.ZipFile(tile['path'], 'r') as zip_ref:
+                        zip_ref.extractall(pathunzip)
+                    self.manifest.update(namefile,'unzipped')
+                    return 'File unzipped from the cache: %s' % (pathunzip)
+                return 'File linked from the cache: %s' % (pathfile)
+
+        # Callbacks called for each chunk: checksum (and progress bar)
+        hashcallback = egmshttptools.egmshashcallback()
+        if (not streaming) and os.path.isfile('%s.part' % (pathfile)):
+            hashcallback.prime('%s.part' % (pathfile))
+        callbacks = [hashcallback]
+        if progressbar:
+            callbacks.append(self.printprogress)
+
+        if streaming:
+            # The .zip file is kept in memory (or in tmpdir for the large files) and dropped after the extraction
+            filespool = tempfile.SpooledTemporaryFile(max_size=spoolsize,dir=tmpdir)
+
+        try:
+            nbtry = 0
+            while True:
+                # Wait for a token of the shared rate limiter
+                self.ratelimiter.acquire(linkfile)
+                try:
+                    if streaming:
+                        # Download the file into the spooled file (resumed from its current size)
+                        filespool.seek(0,2)
+                        totalsize = egmshttptools.downloadstream('%s?id=%s' % (linkfile,self.token),filespool,sizedone=filespool.tell(),callbacks=callbacks)
+                        sizepart = filespool.tell()
+                    else:
+                        # Download the file into a .part file (resumed if the .part file exists)
+                        pathpart, totalsize = egmshttptools.downloadresume('%s?id=%s' % (linkfile,self.token),pathfile,callbacks=callbacks)
+                        sizepart = os.path.getsize(pathpart)
+                    self.ratelimiter.success(linkfile)
+                except urllib.error.HTTPError as e:
+                    nbtry = nbtry + 1
+                    if (e.code in egmshttptools.codethrottle) and nbtry <= maxretry:
+                        # Back off all the workers using this host
+                        delay = self.ratelimiter.throttled(linkfile,e.headers.get('Retry-After'))
                         if self.verbose:
-                            print('\tAlready downloaded (detection of the .zip file)')
+                            with self.lockprint:
+                                print('\tThe server throttles the requests (HTTP %d): back off of %.1f s' % (e.code,delay))
+                        continue
+                    elif e.code == 416 and nbtry <= maxretry:
+                        # The partial file did not match the remote file: restart from the first byte
+                        if streaming:
+                            filespool.seek(0)
+                            filespool.truncate()
+                        continue
+                    else:
+                        return 'An error occurred for %s: %s' % (namefile,e)
+                except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+                    # Broken transfer: the partial file is kept and the download is resumed
+                    nbtry = nbtry + 1
+                    if nbtry <= maxretry:
+                        continue
+                    if streaming:
+                        return 'An error occurred for %s: %s' % (namefile,e)
+                    return 'An error occurred for %s (the partial file is kept for a later run): %s' % (namefile,e)
+
+                # Check the size and the integrity of the file before using it
+                if (not totalsize is None) and sizepart < totalsize:
+                    nbtry = nbtry + 1
+                    if nbtry <= maxretry:
+                        continue
+                    return 'Incomplete file %s (%d / %d bytes)' % (namefile,sizepart,totalsize)
+                if streaming:
+                    filecheck = filespool
+                else:
+                    filecheck = pathpart
+                if ((not totalsize is None) and sizepart > totalsize) or (not egmsapitools.check_zipfile(filecheck)):
+                    if streaming:
+                        filespool.seek(0)
+                        filespool.truncate()
+                    else:
+                        os.remove(pathpart)
+                    nbtry = nbtry + 1
+                    if nbtry <= maxretry:
+                        continue
+                    return 'Corrupted file %s, it has been removed' % (namefile)
+
+                self.manifest.update(namefile,'downloaded',size=sizepart,duration_download=time.time()-timestart)
+                self.manifest.update(namefile,'verified',checksum=hashcallback.hexdigest())
+
+                if self.cache:
+                    self.cache.put(namefile,egmsapitools.check_release_fromfile(namefile)[0],filecheck,hashcallback.hexdigest())
+
+                if streaming:
+                    # Extract the members directly from the spooled file
+                    with zipfile.ZipFile(filespool, 'r') as zip_ref:
+                        zip_ref.extractall(pathunzip)
+                    self.manifest.update(namefile,'unzipped')
+                    return 'File downloaded and unzipped: %s' % (pathunzip)
+                else:
+                    os.replace(pathpart,pathfile)
+                    return 'File downloaded: %s' % (pathfile)
+        finally:
+            if streaming:
+                filespool.close()
 
-                    h = h + 1
+    ################################################################################
+    ## Function to print the progress of a download
+    ################################################################################
+    def printprogress(self,chunk,sizedone,totalsize):
 
-                    self.unzipfile(outputdir=outputdir,unzip=unzipmode,clean=cleanmode)
+        if totalsize:
+            sys.stdout.write('\r\t%.1f / %.1f MB (%d%%)' % (sizedone/1e6,totalsize/1e6,100*sizedone/totalsize))
+            if sizedone >= totalsize:
+                sys.stdout.write('\n')
+        else:
+            sys.stdout.write('\r\t%.1f MB' % (sizedone/1e6))
+        sys.stdout.flush()
 
     ################################################################################
     ## Function to unzip the files
@@ -232,27 +578,57 @@ class egmsdownloader:
         else: 
             cleanmode = kwargs['clean']
 
-        list_files = glob.glob('%s/*/*/*.zip' % (outputdir))
-        
+        if not "nbworkers" in kwargs:
+            nbworkers = 4
+        else: 
+            nbworkers = int(kwargs['nbworkers'])
+        if nbworkers < 1:
+            sys.exit('Error: the number of workers must be at least 1 (in EGMSdownloaderapi.py)')
+
+        if not "force" in kwargs:
+            force = False
+        else: 
+            force = kwargs['force']
+
         if unzipmode:
-            h = 1
-            for fi in list_files: 
-                pathsplit = fi.split('/')
-                namefile = fi.split('/')[-1].split('.')[0]
-                pathdirfile = ''
-                for i1 in np.arange(len(pathsplit)-1):
-                    if i1 == 0:
-                        pathdirfile = pathsplit[i1] 
+            manifest = egmsmanifest.openmanifest(outputdir)
+
+            ## Select the new or modified .zip files (the marker stores the size and the date of the extracted .zip file)
+            list_files = []
+            for fi in glob.glob('%s/*/*/*.zip' % (outputdir)):
+                pathunzip = fi[0:-4]
+                if force or (not os.path.isfile('%s/%s' % (pathunzip,nameunzipmarker))):
+                    list_files.append(fi)
+                else:
+                    with open('%s/%s' % (pathunzip,nameunzipmarker)) as fmarker:
+                        if not fmarker.read() == zipsignature(fi):
+                            list_files.append(fi)
+                        else:
+                            if not manifest.isdone(fi.split('/')[-1],'unzipped'):
+                                manifest.update(fi.split('/')[-1],'unzipped')
+                            if cleanmode:
+                                os.remove(fi)
+
+            if self.verbose:
+                print('\t%d new or modified file(s) to unzip with %d worker(s)' % (len(list_files),nbworkers))
+
+            ## Unzip the files with a pool of processes
+            with concurrent.futures.ProcessPoolExecutor(max_workers=nbworkers,mp_context=egmsapitools.get_mpcontext()) as executor:
+                listfuture = [executor.submit(unzipworker,fi,cleanmode) for fi in list_files]
+
+                h = 1
+                for future in concurrent.futures.as_completed(listfuture):
+                    fi, error = future.result()
+                    if error is None:
+                        if not manifest.isdone(fi.split('/')[-1],'unzipped'):
+                            manifest.update(fi.split('/')[-1],'unzipped')
+                        if self.verbose:
+                            print('%d / %d files: Unzip the file: %s' % (h,len(list_files),fi.split('/')[-1]))
                     else:
-                        pathdirfile = pathdirfile + '/' + pathsplit[i1] 
-                if self.verbose:
-                    print('%d / %d files: Unzip the file: %s' % (h,len(list_files),pathsplit[-1]))
-                h = h + 1
-                with zipfile.ZipFile("%s" %(fi), 'r') as zip_ref:
-                    zip_ref.extractall('%s/%s' % (pathdirfile,namefile))
+                        print('%d / %d files: Error during the unzipping of the file %s: %s' % (h,len(list_files),fi.split('/')[-1],error))
+                    h = h + 1
 
-                if os.path.isdir('%s/%s' % (pathdirfile,namefile)) and (cleanmode): 
-                    os.remove(fi)
+            manifest.close()
         else: 
             if self.verbose:
                 print('\tNo processing.')
@@ -275,13 +651,11 @@ class egmsdownloader:
 
         listdirall = []
         listfileall = []
-        for type in ['L2a', 'L2b', 'L3UD', 'L3EW']:
-            datatmp = eval('self.list%s' % (type))
-            if datatmp: 
-                for idx in np.arange(len(datatmp)): 
-                    release_para = egmsapitools.check_release_fromfile(datatmp[idx])
-                    listdirall.append('%s/%s/%s/%s' % (outputdir,type,release_para[0],datatmp[idx].split('.')[0]))
-                    listfileall.append('%s/%s/%s/%s' % (outputdir,type,release_para[0],datatmp[idx]))
+        for rowi in self.catalog.rows():
+            listdirall.append('%s/%s' % (outputdir,rowi['path'].split('.')[0]))
+            listfileall.append('%s/%s' % (outputdir,rowi['path']))
+        listdirall = set(listdirall)
+        listfileall = set(listfileall)
 
         liststored = glob.glob('%s/*/*/*' % (outputdir))
         liststoredDIR = []
@@ -292,11 +666,15 @@ class egmsdownloader:
             else: 
                 liststoredDIR.append(li)
 
+        manifest = egmsmanifest.openmanifest(outputdir,create=False)
+
         for li in liststoredDIR: 
             if not li in listdirall:
                 if self.verbose: 
                     print('The directory %s is not in the list(s), it will be removed...' % (li))
                 shutil.rmtree(li)
+                if manifest:
+                    manifest.remove(li.split('/')[-1])
             else:
                 if self.verbose:
                     print('The directory %s is in the list(s), it will be kept...' % (li))
@@ -306,10 +684,15 @@ class egmsdownloader:
                 if self.verbose:
                     print('The .zip file %s is not in the list(s), it will be removed...' % (li))
                 os.remove(li)
+                if manifest:
+                    manifest.remove(li.split('/')[-1])
             else:
                 if self.verbose:
                     print('The .zip file %s is in the list(s), it will be kept...' % (li))
 
+        if manifest:
+            manifest.close()
+
         #  Clean the empty directories 
         for i1 in ['L2a', 'L2b', 'L3UD', 'L3EW']:
             for i2 in ['2015_2021', '2018_2022']:
@@ -321,13 +704,36 @@ class egmsdownloader:
                 if len(os.listdir('%s/%s' % (outputdir,i1))) == 0: 
                     shutil.rmtree('%s/%s' % (outputdir,i1))
 
+################################################################################
+## Function to create the signature of a .zip file (size and date)
+################################################################################
+def zipsignature(pathfile):
+
+    statfile = os.stat(pathfile)
 
+    return '%d %d' % (statfile.st_size,statfile.st_mtime_ns)
 
-    
-    
-            
+################################################################################
+## Function to unzip one file (used by the pool of processes)
+################################################################################
+def unzipworker(pathfile,cleanmode):
 
+    pathunzip = pathfile[0:-4]
+    try:
+        signature = zipsignature(pathfile)
+        if os.path.isfile('%s/%s' % (pathunzip,nameunzipmarker)):
+            os.remove('%s/%s' % (pathunzip,nameunzipmarker))
 
-        
-        
+        with zipfile.ZipFile(pathfile, 'r') as zip_ref:
+            zip_ref.extractall(pathunzip)
+
+        # The marker is written only when the extraction is complete
+        with open('%s/%s' % (pathunzip,nameunzipmarker),'w') as fmarker:
+            fmarker.write(signature)
+    except Exception as e:
+        return pathfile, str(e)
+
+    if cleanmode:
+        os.remove(pathfile)
 
+    return pathfile, None
@@ -3,6 +3,8 @@
 # Part of EMGStoolkit.py:
 
 import sys
+import zipfile
+import multiprocessing
 
 ################################################################################
 ## Function to create the extention for the release
@@ -36,4 +38,28 @@ def check_release_fromfile(namefile):
     
     release_para = [inputrelease, ext_release]
 
-    return release_para
\ No newline at end of file
+    return release_para
+
+################################################################################
+## Function to check the integrity of a .zip file
+################################################################################
+def check_zipfile(pathfile): 
+
+    try:
+        with zipfile.ZipFile(pathfile, 'r') as zip_ref:
+            test = zip_ref.testzip() is None
+    except (zipfile.BadZipFile, OSError, EOFError):
+        test = False
+
+    return test
+
+################################################################################
+## Function to get the context of the pools of processes
+################################################################################
+def get_mpcontext(): 
+
+    # The fork method does not re-import EGMStoolkit.py (the script has no __main__ guard)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    else:
+        return multiprocessing.get_context()
@@ -0,0 +1,255 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import glob
+import numpy as np
+import fiona
+import shapely
+from shapely.geometry import Polygon
+from shapely.strtree import STRtree
+
+from functions import esa2egmsburstID
+
+## Name of the index files stored in the directory of the S1 burst ID map
+nameindex = 'egmsburstindex.npy'
+nameblob = 'egmsburstindex.wkb'
+
+## Codes of the categorical attributes
+listsubswath = ['IW1', 'IW2', 'IW3']
+listpass = ['ASCENDING', 'DESCENDING']
+
+## Table of the bursts (one row per burst)
+dtypeindex = np.dtype([('xmin', 'f8'), ('ymin', 'f8'), ('xmax', 'f8'), ('ymax', 'f8'),
+                       ('relative_orbit_number', 'i2'),
+                       ('subswath', 'i1'),
+                       ('orbit_pass', 'i1'),
+                       ('esa_burst_id', 'i8'),
+                       ('egms_burst_id', 'i4'),
+                       ('time_from_anx_sec', 'f8'),
+                       ('wkboffset', 'i8'),
+                       ('wkbsize', 'i4')])
+
+## Number of ROIs from which a tree of the bounding boxes is used
+nbROItree = 16
+
+## Indexes already loaded (path of the map => index)
+loadedindex = dict()
+
+################################################################################
+## Function to get the .sqlite3 file of the S1 burst ID map
+################################################################################
+def getfilesqlite(pathIDmap):
+
+    listfile = sorted(glob.glob('%s/IW/sqlite/*.sqlite3' % (pathIDmap)))
+    if not listfile:
+        return None
+
+    return listfile[-1]
+
+################################################################################
+## Function to check if the index of a map is missing or older than the map
+################################################################################
+def isoutdated(pathIDmap):
+
+    filesqlite = getfilesqlite(pathIDmap)
+    if filesqlite is None:
+        return False
+
+    for namei in [nameindex, nameblob]:
+        if not os.path.isfile('%s/%s' % (pathIDmap,namei)):
+            return True
+        if os.path.getmtime('%s/%s' % (pathIDmap,namei)) < os.path.getmtime(filesqlite):
+            return True
+
+    return False
+
+################################################################################
+## Function to build the index of the S1 burst ID map (once per version of the map)
+################################################################################
+def buildburstindex(pathIDmap,verbose=True):
+
+    filesqlite = getfilesqlite(pathIDmap)
+    if filesqlite is None:
+        return
+
+    if verbose:
+        print('\tBuild the index of the bursts: %s/%s' % (pathIDmap,nameindex))
+
+    geometries = []
+    rows = []
+
+    fiona.supported_drivers["SQLite"] = "r"
+    with fiona.open(filesqlite) as shpfile:
+        for feature in shpfile:
+            geometries.append(Polygon(feature['geometry']["coordinates"][0][0]))
+            rows.append((feature['properties']['relative_orbit_number'],
+                         listsubswath.index(feature['properties']['subswath_name']),
+                         listpass.index(feature['properties']['orbit_pass']),
+                         feature['properties']['burst_id'],
+                         feature['properties']['time_from_anx_sec']))
+
+    table = np.zeros(len(geometries),dtype=dtypeindex)
+    if len(geometries) > 0:
+        bounds = shapely.bounds(np.array(geometries,dtype=object))
+        table['xmin'] = bounds[:,0]
+        table['ymin'] = bounds[:,1]
+        table['xmax'] = bounds[:,2]
+        table['ymax'] = bounds[:,3]
+        for i1, ci in enumerate(['relative_orbit_number', 'subswath', 'orbit_pass', 'esa_burst_id', 'time_from_anx_sec']):
+            table[ci] = [ri[i1] for ri in rows]
+
+        # EGMS burst IDs of all the bursts in one call
+        table['egms_burst_id'] = esa2egmsburstID.get_egms_burst_cycle_id_array(table['relative_orbit_number'],
+                                                                              esa2egmsburstID.get_anx_mid(table['time_from_anx_sec']))[-1]
+
+    # Geometries in a side blob (WKB), decoded only for the candidates
+    listwkb = shapely.to_wkb(np.array(geometries,dtype=object))
+    table['wkbsize'] = [len(wi) for wi in listwkb]
+    table['wkboffset'] = np.cumsum(table['wkbsize']) - table['wkbsize']
+
+    # Write in temporary files first: the index appears complete or not at all
+    with open('%s/%s.tmp' % (pathIDmap,nameblob),'wb') as fout:
+        for wi in listwkb:
+            fout.write(wi)
+    with open('%s/%s.tmp' % (pathIDmap,nameindex),'wb') as fout:
+        np.save(fout,table)
+    os.replace('%s/%s.tmp' % (pathIDmap,nameblob),'%s/%s' % (pathIDmap,nameblob))
+    os.replace('%s/%s.tmp' % (pathIDmap,nameindex),'%s/%s' % (pathIDmap,nameindex))
+
+    if pathIDmap in loadedindex:
+        del loadedindex[pathIDmap]
+
+################################################################################
+## Function to get the index of the S1 burst ID map (built if needed, loaded once)
+################################################################################
+def getburstindex(pathIDmap,verbose=True):
+
+    if isoutdated(pathIDmap):
+        buildburstindex(pathIDmap,verbose=verbose)
+
+    if not pathIDmap in loadedindex:
+        loadedindex[pathIDmap] = egmsburstindex(pathIDmap)
+
+    return loadedindex[pathIDmap]
+
+################################################################################
+## Creation of a class to manage the index of the burst footprints
+################################################################################
+class egmsburstindex:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,pathIDmap):
+        self.pathIDmap = pathIDmap
+
+        # Memory-mapped: only the pages of the used columns/geometries are read
+        self.table = np.load('%s/%s' % (pathIDmap,nameindex),mmap_mode='r')
+        if os.path.getsize('%s/%s' % (pathIDmap,nameblob)) > 0:
+            self.blob = np.memmap('%s/%s' % (pathIDmap,nameblob),dtype=np.uint8,mode='r')
+        else:
+            self.blob = np.zeros(0,dtype=np.uint8)
+        self.tree = None
+
+    def __len__(self):
+        return len(self.table)
+
+    ################################################################################
+    ## Function to decode the geometries of some bursts
+    ################################################################################
+    def geometries(self,listidx):
+
+        listwkb = [self.blob[self.table['wkboffset'][idx]:self.table['wkboffset'][idx]+self.table['wkbsize'][idx]].tobytes() for idx in listidx]
+
+        return shapely.from_wkb(np.array(listwkb,dtype=object))
+
+    ################################################################################
+    ## Function to select the bursts of some tracks/passes (indexes of the bursts, None if no selection)
+    ################################################################################
+    def selecttrackpass(self,Track_user,Pass_user):
+
+        if all([str(ti) == 'None' and pi == 'None' for (ti, pi) in zip(Track_user,Pass_user)]):
+            return None
+
+        # On the attribute columns only: no geometry is decoded
+        relative_orbit_number = np.asarray(self.table['relative_orbit_number'])
+        orbit_pass = np.asarray(self.table['orbit_pass'])
+
+        test = np.zeros(len(self),dtype=bool)
+        for (tracki, passi) in zip(Track_user,Pass_user):
+            testi = np.ones(len(self),dtype=bool)
+            if not str(tracki) == 'None':
+                testi = testi & (relative_orbit_number == tracki)
+            if not passi == 'None':
+                testi = testi & (orbit_pass == listpass.index(passi))
+            test = test | testi
+
+        return np.nonzero(test)[0]
+
+    ################################################################################
+    ## Function to get the bursts intersecting the ROIs (indexes of the bursts)
+    ################################################################################
+    def query(self,listROI,idxselect=None):
+
+        idxROI, idxburst = self.querybatch(listROI,idxselect=idxselect)
+
+        return np.unique(idxburst)
+
+    ################################################################################
+    ## Function to get the pairs (ROI, burst) intersecting each other (indexes of the ROIs and of the bursts)
+    ## idxselect: bursts to consider (e.g., from selecttrackpass), all the bursts if None
+    ################################################################################
+    def querybatch(self,listROI,idxselect=None):
+
+        if len(listROI) == 0 or ((not idxselect is None) and len(idxselect) == 0):
+            return np.array([],dtype=int), np.array([],dtype=int)
+
+        if idxselect is None:
+            xminburst = self.table['xmin']
+            yminburst = self.table['ymin']
+            xmaxburst = self.table['xmax']
+            ymaxburst = self.table['ymax']
+        else:
+            xminburst = self.table['xmin'][idxselect]
+            yminburst = self.table['ymin'][idxselect]
+            xmaxburst = self.table['xmax'][idxselect]
+            ymaxburst = self.table['ymax'][idxselect]
+
+        if len(listROI) <= nbROItree:
+            # Few ROIs: candidates from the bounding boxes (one pass over the columns per ROI)
+            listidxROI = []
+            listidxburst = []
+            for (idxROI, ROi) in enumerate(listROI):
+                xmin, ymin, xmax, ymax = ROi.bounds
+                idxcandidate = np.nonzero((xminburst <= xmax) & (xmaxburst >= xmin) &
+                                          (yminburst <= ymax) & (ymaxburst >= ymin))[0]
+                listidxROI.append(np.full(len(idxcandidate),idxROI,dtype=int))
+                listidxburst.append(idxcandidate)
+            idxROI = np.concatenate(listidxROI)
+            idxburst = np.concatenate(listidxburst)
+        elif idxselect is None:
+            # Many ROIs: candidates from the tree of the bounding boxes of the bursts (built once)
+            if self.tree is None:
+                self.tree = STRtree(shapely.box(xminburst,yminburst,xmaxburst,ymaxburst))
+            idxROI, idxburst = self.tree.query(np.array(listROI,dtype=object))
+        else:
+            # Many ROIs on a selection: tree of the selected bursts only
+            tree = STRtree(shapely.box(xminburst,yminburst,xmaxburst,ymaxburst))
+            idxROI, idxburst = tree.query(np.array(listROI,dtype=object))
+
+        if not idxselect is None:
+            idxburst = np.asarray(idxselect)[idxburst]
+
+        if len(idxburst) == 0:
+            return idxROI, idxburst
+
+        # Exact test with the prepared ROIs, each candidate burst decoded once
+        idxunique, idxinverse = np.unique(idxburst,return_inverse=True)
+        geometries = self.geometries(idxunique)
+        for ROi in listROI:
+            shapely.prepare(ROi)
+        test = shapely.intersects(np.array(listROI,dtype=object)[idxROI],geometries[idxinverse])
+
+        return idxROI[test], idxburst[test]
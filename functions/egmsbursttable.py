@@ -0,0 +1,183 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+from functions import egmsburstindex
+
+## Header of the binary files: magic string, number of bursts, size of the WKB blob
+magicbursttable = b'EGMSBT01'
+dtypeheader = np.dtype([('magic', 'S8'), ('nbburst', '<u8'), ('sizeblob', '<u8')])
+
+## Same columns as the index of the S1 burst ID map (little-endian on disk)
+dtypebursttable = egmsburstindex.dtypeindex.newbyteorder('<')
+
+################################################################################
+## Function to create a table from some bursts of the index
+################################################################################
+def fromindex(burstindex,listidx):
+
+    listidx = np.asarray(listidx,dtype=np.int64)
+
+    table = np.array(burstindex.table[listidx],dtype=dtypebursttable)
+    listwkb = [burstindex.blob[o1:o1+s1].tobytes() for (o1, s1) in zip(table['wkboffset'],table['wkbsize'])]
+
+    return egmsbursttable(table,listwkb)
+
+################################################################################
+## Function to create a table from the dict of the previous versions (track => IW => list of bursts)
+################################################################################
+def fromdict(Data):
+
+    listburst = []
+    for tracki in Data:
+        for iwi in Data[tracki]:
+            listburst = listburst + Data[tracki][iwi]
+
+    table = np.zeros(len(listburst),dtype=dtypebursttable)
+    for idx, bursti in enumerate(listburst):
+        table['relative_orbit_number'][idx] = bursti['relative_orbit_number']
+        table['subswath'][idx] = egmsburstindex.listsubswath.index(bursti['subswath_name'])
+        table['orbit_pass'][idx] = egmsburstindex.listpass.index(bursti['orbit_pass'])
+        table['esa_burst_id'][idx] = bursti['esa_burst_id']
+        table['egms_burst_id'][idx] = bursti['egms_burst_id']
+    bounds = shapely.bounds(np.array([bi['polyburst'] for bi in listburst],dtype=object)).reshape(-1,4)
+    table['xmin'] = bounds[:,0]
+    table['ymin'] = bounds[:,1]
+    table['xmax'] = bounds[:,2]
+    table['ymax'] = bounds[:,3]
+
+    return egmsbursttable(table,[bi['polyburst'].wkb for bi in listburst])
+
+################################################################################
+## Function to read a table from a binary file (memory-mapped)
+################################################################################
+def readbursttable(fin,offset=0):
+
+    header = np.fromfile(fin,dtype=dtypeheader,count=1,offset=offset)
+    if len(header) == 0 or header['magic'][0] != magicbursttable:
+        raise ValueError('Not a burst table: %s' % (fin))
+    nbburst = int(header['nbburst'][0])
+    sizeblob = int(header['sizeblob'][0])
+
+    offset = offset + dtypeheader.itemsize
+    if nbburst > 0:
+        table = np.memmap(fin,dtype=dtypebursttable,mode='r',offset=offset,shape=(nbburst,))
+    else:
+        table = np.zeros(0,dtype=dtypebursttable)
+
+    offset = offset + nbburst*dtypebursttable.itemsize
+    if sizeblob > 0:
+        blob = np.memmap(fin,dtype=np.uint8,mode='r',offset=offset,shape=(sizeblob,))
+    else:
+        blob = np.zeros(0,dtype=np.uint8)
+
+    return egmsbursttable(table,blob), offset + sizeblob
+
+################################################################################
+## Creation of a class to manage the selected bursts (one column per attribute, WKB geometries)
+################################################################################
+class egmsbursttable:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,table=None,blob=None):
+
+        if table is None:
+            table = np.zeros(0,dtype=dtypebursttable)
+        self.table = table
+
+        # The geometries are given as a list of WKB (offsets to compute) or as a blob
+        if blob is None:
+            blob = []
+        if isinstance(blob, list):
+            self.table = np.array(self.table,dtype=dtypebursttable)
+            self.table['wkbsize'] = [len(wi) for wi in blob]
+            self.table['wkboffset'] = np.cumsum(self.table['wkbsize']) - self.table['wkbsize']
+            blob = np.frombuffer(b''.join(blob),dtype=np.uint8)
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.table)
+
+    def __repr__(self):
+        return 'egmsbursttable: %d burst(s), %d track(s)' % (len(self),len(self.tracks()))
+
+    ################################################################################
+    ## Function to get the name of the tracks (e.g., ASCENDING_0088), for all the bursts or unique
+    ################################################################################
+    def tracknames(self):
+        return np.array(['%s_%04d' % (egmsburstindex.listpass[pi],ri) for (pi, ri) in zip(self.table['orbit_pass'],self.table['relative_orbit_number'])])
+
+    def tracks(self):
+        return np.unique(self.tracknames()).tolist()
+
+    ################################################################################
+    ## Function to get the name of the subswaths (e.g., IW1)
+    ################################################################################
+    def subswathnames(self):
+        return np.array(egmsburstindex.listsubswath)[self.table['subswath']]
+
+    ################################################################################
+    ## Function to decode the geometries (all the bursts or some of them)
+    ################################################################################
+    def geometries(self,listidx=None):
+
+        if listidx is None:
+            listidx = np.arange(len(self))
+
+        listwkb = [self.blob[self.table['wkboffset'][idx]:self.table['wkboffset'][idx]+self.table['wkbsize'][idx]].tobytes() for idx in listidx]
+
+        return shapely.from_wkb(np.array(listwkb,dtype=object))
+
+    ################################################################################
+    ## Function to select some bursts (indexes or boolean mask)
+    ################################################################################
+    def select(self,listidx):
+
+        if isinstance(listidx, np.ndarray) and listidx.dtype == bool:
+            listidx = np.nonzero(listidx)[0]
+
+        table = np.array(self.table[listidx],dtype=dtypebursttable)
+        listwkb = [self.blob[o1:o1+s1].tobytes() for (o1, s1) in zip(table['wkboffset'],table['wkbsize'])]
+
+        return egmsbursttable(table,listwkb)
+
+    ################################################################################
+    ## Function to add the bursts of another table (the bursts already in the table are ignored)
+    ################################################################################
+    def append(self,other):
+
+        if len(other) == 0:
+            return
+
+        # A burst is identified by its ESA burst ID and its subswath
+        known = set(zip(self.table['esa_burst_id'].tolist(),self.table['subswath'].tolist()))
+        listnew = [idx for idx, ki in enumerate(zip(other.table['esa_burst_id'].tolist(),other.table['subswath'].tolist())) if not ki in known]
+        if not listnew:
+            return
+        other = other.select(np.array(listnew))
+
+        tablenew = np.array(other.table,dtype=dtypebursttable)
+        tablenew['wkboffset'] = tablenew['wkboffset'] + len(self.blob)
+
+        self.table = np.concatenate([np.array(self.table,dtype=dtypebursttable), tablenew])
+        self.blob = np.concatenate([np.asarray(self.blob,dtype=np.uint8), np.asarray(other.blob,dtype=np.uint8)])
+
+    ################################################################################
+    ## Function to write the table into a binary file (already open)
+    ################################################################################
+    def write(self,fout):
+
+        header = np.zeros(1,dtype=dtypeheader)
+        header['magic'] = magicbursttable
+        header['nbburst'] = len(self.table)
+        header['sizeblob'] = len(self.blob)
+
+        fout.write(header.tobytes())
+        fout.write(np.ascontiguousarray(self.table,dtype=dtypebursttable).tobytes())
+        fout.write(np.ascontiguousarray(self.blob,dtype=np.uint8).tobytes())
@@ -0,0 +1,171 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import threading
+import subprocess
+import tempfile
+
+## Name of the index of the cache
+namecacheindex = 'egmscache.sqlite3'
+
+################################################################################
+## Function to open the tile cache (None if no cache directory is defined)
+################################################################################
+def opencache(cachedir=None,cachesize=None):
+
+    if cachedir is None:
+        cachedir = os.environ.get('EGMSTILECACHE')
+    if cachedir is None or cachedir == 'None':
+        return None
+
+    if cachesize is None:
+        cachesize = float(os.environ.get('EGMSTILECACHESIZE',100))
+
+    cache = egmstilecache(cachedir,cachesize)
+    cache.evict()
+
+    return cache
+
+################################################################################
+## Function to link a file (hardlink, then reflink/copy)
+################################################################################
+def linkfile(pathin,pathout):
+
+    try:
+        os.link(pathin,pathout)
+        return
+    except OSError:
+        pass
+
+    # Other file system: copy-on-write clone if possible, else a real copy
+    if sys.platform.startswith('linux'):
+        if subprocess.call(['cp','--reflink=auto',pathin,pathout],stderr=subprocess.DEVNULL) == 0:
+            return
+    shutil.copyfile(pathin,pathout)
+
+################################################################################
+## Creation of a class to manage the content-addressed cache of the tiles
+################################################################################
+class egmstilecache:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,cachedir,cachesize=100):
+        self.cachedir = cachedir
+        self.cachesize = cachesize  # Maximal size in GB
+        self.lock = threading.Lock()
+
+        if not os.path.isdir('%s/objects' % (cachedir)):
+            os.makedirs('%s/objects' % (cachedir))
+
+        # The index can be shared by several runs (timeout for the sqlite locks)
+        self.connection = sqlite3.connect('%s/%s' % (cachedir,namecacheindex),timeout=60,check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tiles (name TEXT PRIMARY KEY, release TEXT, checksum TEXT, size INTEGER, lastaccess REAL)')
+        self.connection.commit()
+
+    ################################################################################
+    ## Function to print the attributes
+    ################################################################################
+    def print(self):
+        nb, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size),0) FROM tiles').fetchone()
+        print('\tTile cache %s: %d tile(s), %.2f / %.2f GB' % (self.cachedir,nb,size/1e9,self.cachesize))
+
+    ################################################################################
+    ## Function to get the path of an object
+    ################################################################################
+    def pathobject(self,checksum):
+        return '%s/objects/%s/%s.zip' % (self.cachedir,checksum[0:2],checksum)
+
+    ################################################################################
+    ## Function to look for a tile in the cache
+    ################################################################################
+    def lookup(self,name):
+
+        with self.lock:
+            row = self.connection.execute('SELECT checksum, size FROM tiles WHERE name = ?',[name]).fetchone()
+            if row is None:
+                return None
+            if not os.path.isfile(self.pathobject(row[0])):
+                self.connection.execute('DELETE FROM tiles WHERE name = ?',[name])
+                self.connection.commit()
+                return None
+            self.connection.execute('UPDATE tiles SET lastaccess = ? WHERE name = ?',[time.time(),name])
+            self.connection.commit()
+
+        return {'checksum': row[0], 'size': row[1], 'path': self.pathobject(row[0])}
+
+    ################################################################################
+    ## Function to link a tile of the cache into the output directory
+    ################################################################################
+    def get(self,name,pathout):
+
+        tile = self.lookup(name)
+        if tile is None:
+            return None
+
+        linkfile(tile['path'],pathout)
+
+        return tile
+
+    ################################################################################
+    ## Function to add a tile to the cache (path or file object)
+    ################################################################################
+    def put(self,name,release,pathfile,checksum):
+
+        pathobj = self.pathobject(checksum)
+        if not os.path.isdir(os.path.dirname(pathobj)):
+            os.makedirs(os.path.dirname(pathobj),exist_ok=True)
+
+        if not os.path.isfile(pathobj):
+            # Write in a temporary file of the cache first: the object appears complete or not at all
+            (fd, pathtmp) = tempfile.mkstemp(dir=os.path.dirname(pathobj),suffix='.tmp')
+            os.close(fd)
+            os.remove(pathtmp)
+            if isinstance(pathfile, str):
+                linkfile(pathfile,pathtmp)
+            else:
+                pathfile.seek(0)
+                with open(pathtmp,'wb') as fout:
+                    shutil.copyfileobj(pathfile,fout)
+            os.replace(pathtmp,pathobj)
+
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO tiles (name, release, checksum, size, lastaccess) VALUES (?,?,?,?,?)',
+                                    [name,release,checksum,os.path.getsize(pathobj),time.time()])
+            self.connection.commit()
+
+        self.evict()
+
+    ################################################################################
+    ## Function to remove the least recently used tiles above the maximal size
+    ################################################################################
+    def evict(self):
+
+        with self.lock:
+            sizetotal = self.connection.execute('SELECT COALESCE(SUM(size),0) FROM tiles').fetchone()[0]
+            if sizetotal <= self.cachesize*1e9:
+                return
+
+            for (name, checksum, size) in self.connection.execute('SELECT name, checksum, size FROM tiles ORDER BY lastaccess ASC').fetchall():
+                self.connection.execute('DELETE FROM tiles WHERE name = ?',[name])
+                # The object can be shared by several names
+                if self.connection.execute('SELECT COUNT(*) FROM tiles WHERE checksum = ?',[checksum]).fetchone()[0] == 0:
+                    if os.path.isfile(self.pathobject(checksum)):
+                        os.remove(self.pathobject(checksum))
+                sizetotal = sizetotal - size
+                if sizetotal <= self.cachesize*1e9:
+                    break
+            self.connection.commit()
+
+    ################################################################################
+    ## Function to close the cache
+    ################################################################################
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,103 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+## Columns of the catalog
+listcolumn = ['name', 'level', 'type', 'release', 'track', 'burst', 'component', 'link', 'path']
+
+## Types of EGMS data (i.e., directories of the output directory)
+listtype = ['L2a', 'L2b', 'L3UD', 'L3EW']
+
+################################################################################
+## Creation of a class to manage the catalog of the tiles (one column per attribute)
+################################################################################
+class egmscatalog:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self):
+        self.columns = dict()
+        for ci in listcolumn:
+            self.columns[ci] = []
+        self.index = dict()  # Name of the tile => row
+
+    def __len__(self):
+        return len(self.columns['name'])
+
+    def __contains__(self,name):
+        return name in self.index
+
+    ################################################################################
+    ## Function to print the attributes
+    ################################################################################
+    def print(self):
+        for typei in listtype:
+            print('\t%s: %d tile(s)' % (typei,len(self.select(type=typei))))
+
+    ################################################################################
+    ## Function to add a tile (ignored if the tile is already in the catalog)
+    ################################################################################
+    def add(self,name,level,type,release,link,track=None,burst=None,component=None):
+
+        if name in self.index:
+            return False
+
+        rowi = {'name': name,
+                'level': level,
+                'type': type,
+                'release': release,
+                'track': track,
+                'burst': burst,
+                'component': component,
+                'link': link,
+                'path': '%s/%s/%s' % (type,release,name)}
+
+        self.index[name] = len(self.columns['name'])
+        for ci in listcolumn:
+            self.columns[ci].append(rowi[ci])
+
+        return True
+
+    ################################################################################
+    ## Function to get a row
+    ################################################################################
+    def row(self,idx):
+
+        rowi = dict()
+        for ci in listcolumn:
+            rowi[ci] = self.columns[ci][idx]
+
+        return rowi
+
+    ################################################################################
+    ## Function to select the rows (e.g., select(type='L2a',release='2018_2022')), sorted by one or several columns
+    ################################################################################
+    def select(self,sortby='name',**kwargs):
+
+        listidx = range(len(self))
+        for ci in kwargs:
+            if isinstance(kwargs[ci], list):
+                valuesi = set(kwargs[ci])
+                listidx = [idx for idx in listidx if self.columns[ci][idx] in valuesi]
+            else:
+                listidx = [idx for idx in listidx if self.columns[ci][idx] == kwargs[ci]]
+
+        if not sortby is None:
+            if not isinstance(sortby, list):
+                sortby = [sortby]
+            listidx = sorted(listidx,key=lambda idx: [self.columns[ci][idx] for ci in sortby])
+
+        return list(listidx)
+
+    ################################################################################
+    ## Function to get the rows of a selection
+    ################################################################################
+    def rows(self,sortby='name',**kwargs):
+        return [self.row(idx) for idx in self.select(sortby=sortby,**kwargs)]
+
+    ################################################################################
+    ## Function to get the values of a column for a selection
+    ################################################################################
+    def values(self,column,sortby='name',**kwargs):
+        return [self.columns[column][idx] for idx in self.select(sortby=sortby,**kwargs)]
@@ -0,0 +1,149 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+import shapely
+from osgeo import ogr
+
+from functions import egmsroitools
+
+## Version of the store (a new version is a new file)
+versioncountrystore = 1
+namecountrystore = 'egmscountries_v%d.sqlite3' % (versioncountrystore)
+
+## Tolerances of simplification (degrees, 0.0 for the full resolution)
+listtolerance = [0.0, 0.001, 0.01, 0.05]
+
+################################################################################
+## Function to open the store of the country boundaries
+################################################################################
+def opencountrystore(storedir=None):
+
+    if storedir is None:
+        if 'EGMSCOUNTRYSTORE' in os.environ:
+            storedir = os.environ['EGMSCOUNTRYSTORE']
+        elif 'PATHS1BURSTIDMAP' in os.environ:
+            storedir = '%s/egmscountries' % (os.environ['PATHS1BURSTIDMAP'])
+        else:
+            # Never in the working directory: cache directory of the user
+            storedir = '%s/egmstoolkit/egmscountries' % (os.environ.get('XDG_CACHE_HOME',os.path.expanduser('~/.cache')))
+
+    return egmscountrystore(storedir)
+
+################################################################################
+## Function to get the boundaries of a country with GMT (None if GMT is not installed)
+################################################################################
+def fromgmt(code):
+
+    if shutil.which('gmt') is None:
+        return None
+
+    # GMT writes its files in the working directory: use a temporary one
+    with tempfile.TemporaryDirectory() as tmpdir:
+        cmd = 'gmt coast -JU6i -E%s -M > bbox.GMT' % (code)
+        subprocess.call(cmd,shell=True,cwd=tmpdir)
+        if (not os.path.isfile('%s/bbox.GMT' % (tmpdir))) or os.path.getsize('%s/bbox.GMT' % (tmpdir)) == 0:
+            return None
+        listROI = egmsroitools.readROIfile('%s/bbox.GMT' % (tmpdir),srcsrs='EPSG:4326')
+
+    if not listROI:
+        return None
+
+    return listROI
+
+################################################################################
+## Creation of a class to manage the store of the country boundaries (ISO code => polygons)
+################################################################################
+class egmscountrystore:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,storedir):
+        self.storedir = storedir
+        self.pathstore = '%s/%s' % (storedir,namecountrystore)
+
+        if not os.path.isdir(storedir):
+            os.makedirs(storedir)
+
+        self.connection = sqlite3.connect(self.pathstore,timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS countries (code TEXT, tolerance REAL, nbpolygon INTEGER, wkb BLOB, PRIMARY KEY (code, tolerance))')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS sources (code TEXT PRIMARY KEY, source TEXT, time REAL)')
+        self.connection.commit()
+
+    ################################################################################
+    ## Function to print the attributes
+    ################################################################################
+    def print(self):
+        print('\tCountry store %s (version %d): %d code(s)' % (self.pathstore,versioncountrystore,len(self.codes())))
+
+    ################################################################################
+    ## Function to get the list of the stored codes
+    ################################################################################
+    def codes(self):
+        return [ri[0] for ri in self.connection.execute('SELECT code FROM sources ORDER BY code').fetchall()]
+
+    ################################################################################
+    ## Function to get the polygons of a code (None if not stored)
+    ################################################################################
+    def lookup(self,code,tolerance=0.0):
+
+        # Closest stored tolerance below the requested one
+        row = self.connection.execute('SELECT wkb FROM countries WHERE code = ? AND tolerance <= ? ORDER BY tolerance DESC LIMIT 1',
+                                      [code.upper(),tolerance]).fetchone()
+        if row is None:
+            return None
+
+        return egmsroitools.geometrytopolygons(shapely.from_wkb(row[0]))
+
+    ################################################################################
+    ## Function to add the polygons of a code (simplified at all the tolerances)
+    ################################################################################
+    def put(self,code,listROI,source='None'):
+
+        multi = shapely.multipolygons(listROI)
+        for tolerancei in listtolerance:
+            if tolerancei == 0.0:
+                multii = multi
+            else:
+                multii = shapely.simplify(multi,tolerancei,preserve_topology=True)
+            self.connection.execute('INSERT OR REPLACE INTO countries (code, tolerance, nbpolygon, wkb) VALUES (?,?,?,?)',
+                                    [code.upper(),tolerancei,len(listROI),shapely.to_wkb(multii)])
+        self.connection.execute('INSERT OR REPLACE INTO sources (code, source, time) VALUES (?,?,?)',[code.upper(),source,time.time()])
+        self.connection.commit()
+
+    ################################################################################
+    ## Function to import the polygons of a vector file (e.g., Natural Earth admin-0, one feature per country)
+    ################################################################################
+    def importfile(self,pathfile,field='ISO_A2'):
+
+        dictROI = dict()
+        dataset = ogr.Open(pathfile)
+        for layer in dataset:
+            for feature in layer:
+                code = feature.GetField(field)
+                geometry = feature.GetGeometryRef()
+                if code is None or geometry is None:
+                    continue
+                if not code in dictROI:
+                    dictROI[code] = []
+                dictROI[code] = dictROI[code] + egmsroitools.geometrytopolygons(shapely.from_wkb(bytes(geometry.ExportToWkb())))
+        dataset = None
+
+        for code in dictROI:
+            if dictROI[code]:
+                self.put(code,dictROI[code],source=os.path.basename(pathfile))
+
+        return list(dictROI.keys())
+
+    ################################################################################
+    ## Function to close the store
+    ################################################################################
+    def close(self):
+        self.connection.close()
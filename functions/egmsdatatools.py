@@ -5,6 +5,8 @@
 import sys
 
 from functions import egmsapitools
+from functions import egmsmanifest
+from functions import egmsroitools
 import numpy as np
 import glob
 import pandas as pd 
@@ -14,6 +16,17 @@ import fiona
 from shapely.geometry import Polygon, mapping, shape, LineString, Point
 import pyproj
 import shutil
+import tempfile
+import shapely
+import concurrent.futures
+
+# Optional: columnar formats of the merged files (Parquet and Feather)
+try:
+    import pyarrow
+    import pyarrow.parquet
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
 
 source_crs = 'epsg:4326'
 target_crs = 'epsg:3035'
@@ -21,6 +34,19 @@ target_crs = 'epsg:3035'
 latlon_to_meter = pyproj.Transformer.from_crs(source_crs, target_crs)
 meter_to_latlon = pyproj.Transformer.from_crs(target_crs,source_crs)
 
+## Number of rows read at once when merging the .csv files (minimal number with a memory budget)
+nbrowchunk = 100000
+nbrowchunkmin = 1000
+
+## Formats of the merged files
+listformat = ['csv', 'parquet', 'feather']
+
+## Columns always saved in the merged files (stored in float64, statistics in the Parquet files)
+listcoordinate = ['latitude', 'longitude', 'easting', 'northing', 'height', 'height_wgs84']
+
+## Compression of the columnar formats
+compressionarrow = 'zstd'
+
 ################################################################################
 ## Function to interpolate the data into a raster
 ################################################################################
@@ -79,7 +105,7 @@ def datagridding(**kwargs):
 
     ## Create the list of files
     if namefile == 'all':
-        list_filetmp = glob.glob('%s/*.csv' %(inputdir))
+        list_filetmp = glob.glob('%s/*.csv' %(inputdir)) + glob.glob('%s/*.parquet' %(inputdir)) + glob.glob('%s/*.feather' %(inputdir))
 
         list_noclip = []
         list_clip = []
@@ -125,12 +151,13 @@ def datagridding(**kwargs):
         if verbose:
             print('\t\tWrite the .vrt') 
 
-        namefile = fi[0:-4].split('/')[-1]
+        namefile, extfile = os.path.splitext(fi.split('/')[-1])
         
+        # The Parquet/Feather files need GDAL built with the Arrow/Parquet drivers
         with open('%s/%s.vrt' %(outputdir,namefile),'w') as fout:
             fout.write('<OGRVRTDataSource>\n')
             fout.write('\t<OGRVRTLayer name="%s">\n' % (namefile))
-            fout.write('\t\t<SrcDataSource>%s/%s.csv</SrcDataSource>\n'% (inputdir,namefile))
+            fout.write('\t\t<SrcDataSource>%s/%s%s</SrcDataSource>\n'% (inputdir,namefile,extfile))
             fout.write('\t\t<GeometryType>wkbPoint</GeometryType>\n')
             fout.write('\t\t<GeometryField encoding="PointFromColumns" x="easting" y="northing"/>\n')
             fout.write('\t\t</OGRVRTLayer>\n')
@@ -195,6 +222,10 @@ def removerawdata(**kwargs):
             if os.path.isdir('%s/%s' % (inputdir,i1)):
                 shutil.rmtree('%s/%s' % (inputdir,i1))
 
+        # The manifest describes the raw-data directories
+        if os.path.isfile('%s/%s' % (inputdir,egmsmanifest.namemanifest)):
+            os.remove('%s/%s' % (inputdir,egmsmanifest.namemanifest))
+
     li = glob.glob('bbox.*')
     if li:
         if not forcemode:
@@ -238,6 +269,11 @@ def datamergingcsv(**kwargs):
         else:
             sys.exit('ERROR')
 
+    if not "outputformat" in kwargs:
+        outputformat = 'csv'
+    else: 
+        outputformat = kwargs['outputformat']
+
     if 'infoEGMSdownloader' in kwargs: 
         infoEGMSdownloader = kwargs['infoEGMSdownloader']
     else:
@@ -249,12 +285,29 @@ def datamergingcsv(**kwargs):
     else: 
         verbose = kwargs['verbose']
 
+    if not "nbworkers" in kwargs:
+        nbworkers = 4
+    else: 
+        nbworkers = int(kwargs['nbworkers'])
+
+    # Memory for all the groups merged at the same time (in MB, available memory if None)
+    if not "maxmemory" in kwargs:
+        maxmemory = None
+    else: 
+        maxmemory = kwargs['maxmemory']
+
     if not (verbose == True or verbose == False):
         sys.error('Error: bad parameter of the verbose parameter [True or False]')
     if not (os.path.isdir(outputdir)):
         sys.error('Error: the output directory %s is not a directory.' % (outputdir))
     if not (os.path.isdir(inputdir)):
         sys.error('Error: the input directory %s is not a directory.' % (inputdir))
+    if nbworkers < 1:
+        sys.exit('Error: the number of workers must be at least 1.')
+    if not outputformat in listformat:
+        sys.exit('Error: the output format %s is not correct [%s].' % (outputformat,' or '.join(listformat)))
+    if (not outputformat == 'csv') and pyarrow is None:
+        sys.exit('Error: the pyarrow package is required for the %s format.' % (outputformat))
 
     if verbose:
         print('EMGStoolkit.py => egmsdatatools: merge the .csv files')
@@ -262,16 +315,13 @@ def datamergingcsv(**kwargs):
         print('\tInput Directory: %s' % (inputdir))
         print('\tSelected parameters: %s' % (paratosave))
         print('\tMode: %s' % (mode))
+        print('\tOutput format: %s' % (outputformat))
 
     ## Creation of the list for merging
     if mode == 'onlist': # Based on the list
         listfiles = []
-        for type in ['L2a', 'L2b', 'L3UD', 'L3EW']:
-            datatmp = eval('infoEGMSdownloader.list%s' % (type))
-            if datatmp: 
-                for idx in np.arange(len(datatmp)): 
-                    release_para = egmsapitools.check_release_fromfile(datatmp[idx])
-                    listfiles.append('%s/%s/%s/%s' % (inputdir,type,release_para[0],datatmp[idx].split('.')[0]))
+        for rowi in infoEGMSdownloader.catalog.rows(sortby=['type','name']):
+            listfiles.append('%s/%s' % (inputdir,rowi['path'].split('.')[0]))
     else: # Based on the files
         listfiles = glob.glob('%s/*/*/*/*.csv' % (inputdir))
 
@@ -280,28 +330,31 @@ def datamergingcsv(**kwargs):
 
     filedict, release, level, track, L3compall = listtodictmerged(listfiles)
     
-    for ri in release:
-        for li in level:
-            if not li == 'L3':
-                for ti in track:
-                    try:
-                        file_list = filedict[ri][li][ti]['Files']
-                        name_file = filedict[ri][li][ti]['Name']
-                        if verbose:
-                            print('Merging for %s...' % (name_file))
-                        filemergingcsv(inputdir,outputdir,name_file,file_list,paratosave)
-                    except:
-                        a = 'dummy'
-            else:
-                for ci in L3compall:
-                    try:
-                        file_list = filedict[ri][li][ci]['Files']
-                        name_file = filedict[ri][li][ci]['Name']
-                        if verbose:
-                            print('Merging for %s...' % (name_file))
-                        filemergingcsv(inputdir,outputdir,name_file,file_list,paratosave)
-                    except:
-                        a = 'dummy'
+    manifest = egmsmanifest.openmanifest(inputdir)
+
+    # One scan of the input directory for all the merged files
+    dictpath = findfiles(inputdir,'csv')
+
+    ## Merge the groups (track or L3 component) with a pool of processes
+    listgroup = listgroupmerged(filedict,release,level,track,L3compall)
+    listmemory = [memorymergedcsv([dictpath[fi] for fi in file_list if fi in dictpath]) for (name_file, file_list) in listgroup]
+    nbworkersi = nbworkersmerged(nbworkers,maxmemory,listmemory)
+
+    # With a memory budget, each group merged at the same time gets its share (size of the chunks)
+    if maxmemory is None:
+        maxmemorygroup = None
+    else:
+        maxmemorygroup = maxmemory / nbworkersi
+    listargs = [(inputdir,outputdir,name_file,file_list,paratosave,dictpath,nbrowchunk,outputformat,maxmemorygroup) for (name_file, file_list) in listgroup]
+
+    if verbose:
+        print('\t%d group(s) to merge with %d worker(s)' % (len(listgroup),nbworkersi))
+
+    errors = mergegroups(filemergingcsv,listgroup,listargs,nbworkersi,manifest,verbose)
+
+    manifest.close()
+
+    return errors
 
 ################################################################################
 ## Function to merge the datasets
@@ -338,12 +391,25 @@ def datamergingtiff(**kwargs):
     else: 
         verbose = kwargs['verbose']
 
+    if not "nbworkers" in kwargs:
+        nbworkers = 4
+    else: 
+        nbworkers = int(kwargs['nbworkers'])
+
+    # Memory for all the groups merged at the same time (in MB, available memory if None)
+    if not "maxmemory" in kwargs:
+        maxmemory = None
+    else: 
+        maxmemory = kwargs['maxmemory']
+
     if not (verbose == True or verbose == False):
         sys.error('Error: bad parameter of the verbose parameter [True or False]')
     if not (os.path.isdir(outputdir)):
         sys.error('Error: the output directory %s is not a directory.' % (outputdir))
     if not (os.path.isdir(inputdir)):
         sys.error('Error: the input directory %s is not a directory.' % (inputdir))
+    if nbworkers < 1:
+        sys.exit('Error: the number of workers must be at least 1.')
 
     if verbose:
         print('EMGStoolkit.py => egmsdatatools: merge the .tiff files (only for the L3 level)')
@@ -354,12 +420,8 @@ def datamergingtiff(**kwargs):
     ## Creation of the list for merging
     if mode == 'onlist': # Based on the list
         listfiles = []
-        for type in ['L2a', 'L2b', 'L3UD', 'L3EW']:
-            datatmp = eval('infoEGMSdownloader.list%s' % (type))
-            if datatmp: 
-                for idx in np.arange(len(datatmp)): 
-                    release_para = egmsapitools.check_release_fromfile(datatmp[idx])
-                    listfiles.append('%s/%s/%s/%s' % (inputdir,type,release_para[0],datatmp[idx].split('.')[0]))
+        for rowi in infoEGMSdownloader.catalog.rows(sortby=['type','name']):
+            listfiles.append('%s/%s' % (inputdir,rowi['path'].split('.')[0]))
     else: # Based on the files
         listfiles = glob.glob('%s/*/*/*/*.tiff' % (inputdir))
     
@@ -368,20 +430,25 @@ def datamergingtiff(**kwargs):
 
     filedict, release, level, track, L3compall = listtodictmerged(listfiles)
     
-    for ri in release:
-        for li in level:
-            if li == 'L3':
-                for ci in L3compall:
-                    try:
+    manifest = egmsmanifest.openmanifest(inputdir)
+
+    # One scan of the input directory for all the merged files
+    dictpath = findfiles(inputdir,'tiff')
+
+    ## Merge the groups (L3 component) with a pool of processes
+    listgroup = listgroupmerged(filedict,release,level,track,L3compall,onlyL3=True)
+    listargs = [(inputdir,outputdir,name_file,file_list,verbose,dictpath) for (name_file, file_list) in listgroup]
+    listmemory = [memorymergedtiff([dictpath[fi] for fi in file_list if fi in dictpath]) for (name_file, file_list) in listgroup]
+    nbworkersi = nbworkersmerged(nbworkers,maxmemory,listmemory)
+
+    if verbose:
+        print('\t%d group(s) to merge with %d worker(s)' % (len(listgroup),nbworkersi))
+
+    errors = mergegroups(filemergingtiff,listgroup,listargs,nbworkersi,manifest,verbose)
 
-                        file_list = filedict[ri][li][ci]['Files']
-                        name_file = filedict[ri][li][ci]['Name']
+    manifest.close()
 
-                        if verbose:
-                            print('Merging for %s...' % (name_file))
-                        filemergingtiff(inputdir,outputdir,name_file,file_list,verbose)
-                    except:
-                        a = 'dummy'
+    return errors
 
 ################################################################################
 ## Function to clip the data
@@ -408,6 +475,12 @@ def dataclipping(**kwargs):
     else: 
         shapefile = kwargs['shapefile']
 
+    # ROIs in memory (S1ROIparameter): no vector file needed
+    if not "infoS1ROIparameter" in kwargs:
+        infoS1ROIparameter = None
+    else: 
+        infoS1ROIparameter = kwargs['infoS1ROIparameter']
+
     if not "verbose" in kwargs:
         verbose = True
     else: 
@@ -420,11 +493,14 @@ def dataclipping(**kwargs):
         else:
             print('\tInput Directory: %s' % (inputdir))
             print('\tOutput Directory: %s' % (outputdir))
-        print('\tShapefile: %s' % (shapefile))
+        if infoS1ROIparameter is None:
+            print('\tShapefile: %s' % (shapefile))
+        else:
+            print('\tROIs of the search: %d polygon(s)' % (len(infoS1ROIparameter.ROIs)))
 
     ## Create the list of files
     if namefile == 'all':
-        list_file = glob.glob('%s/*.csv' %(outputdir)) + glob.glob('%s/*.tiff' %(outputdir))
+        list_file = glob.glob('%s/*.csv' %(outputdir)) + glob.glob('%s/*.tiff' %(outputdir)) + glob.glob('%s/*.parquet' %(outputdir)) + glob.glob('%s/*.feather' %(outputdir))
     else:
         tmp = namefile.split(',')
         if not '/' in namefile:
@@ -437,11 +513,21 @@ def dataclipping(**kwargs):
     if not list_file:
         sys.exit('Error: the list of files is empty.')
 
+    ## Polygons of the ROIs (EPSG:4326 and EPSG:3035), read once
+    if infoS1ROIparameter is None:
+        listROI = egmsroitools.readROIfile(shapefile)
+        listROIepsg3035 = [egmsroitools.toepsg3035(ROi,segment=0.1) for ROi in listROI]
+    else:
+        listROI = infoS1ROIparameter.readROI()
+        listROIepsg3035 = infoS1ROIparameter.getROIsepsg3035(listROI)
+
     ## Cropping and clipping
+    manifest = egmsmanifest.openmanifest(inputdir,create=False)
+
     it = 1
     ittotal = 0
     for fi in list_file:
-        if fi.split('.')[-1] == 'csv' and (not 'clipped' in fi):
+        if fi.split('.')[-1] in listformat and (not 'clipped' in fi):
             ittotal = ittotal+1
         elif fi.split('.')[-1] == 'tiff' and (not 'cropped' in fi):
             ittotal = ittotal+1
@@ -454,32 +540,6 @@ def dataclipping(**kwargs):
             if verbose:
                 print('\t%d / %d file(s): Clip the file %s to %s...' % (it,ittotal,fi,newname))
 
-            listROI = []
-            listROIepsg3035 = []
-
-            schema = {
-                'geometry': 'Polygon',
-                'properties' : {'id':'int'}
-                }
-
-            with fiona.open(shapefile,'r','ESRI Shapefile', schema) as shpfile:
-                for feature in shpfile:
-                    coordinates = []
-                    Xcoord = []
-                    Ycoord = []
-                    line = shape(feature['geometry'])
-                    if isinstance(line, LineString):
-                        for index, point in enumerate(line.coords):
-                            if index == 0:
-                                first_pt = point
-                            coordinates.append(point)
-                            X, Y = latlon_to_meter.transform(point[1],point[0])
-                            Xcoord.append(X)
-                            Ycoord.append(Y)
-                    if len(coordinates) >= 3:
-                        listROI.append(Polygon(coordinates))
-                        listROIepsg3035.append(Polygon(list(zip(Xcoord, Ycoord))))
-
             h = 0
             headerline = []
         
@@ -504,22 +564,36 @@ def dataclipping(**kwargs):
                                     outfile.write(line)
 
                     h = h + 1
+
+            if manifest:
+                manifest.updatemerged(fi.split('/')[-1][0:-4],'clipped')
+
+        elif fi.split('.')[-1] in ['parquet', 'feather'] and (not 'clipped' in fi):
+            if pyarrow is None:
+                sys.exit('Error: the pyarrow package is required for the %s format.' % (fi.split('.')[-1]))
+
+            newname = '%s_clipped.%s' % (os.path.splitext(fi)[0],fi.split('.')[-1])
+
+            if verbose:
+                print('\t%d / %d file(s): Clip the file %s to %s...' % (it,ittotal,fi,newname))
+
+            fileclippingarrow(fi,newname,listROIepsg3035)
+
+            if manifest:
+                manifest.updatemerged(os.path.splitext(fi.split('/')[-1])[0],'clipped')
             
         elif fi.split('.')[-1] == 'tiff' and (not 'cropped' in fi):
 
-            ## Create the polygon for cropping 
-            name_bbox_clipping1 = '%s_forclipping1.GeoJSON' % (shapefile[0:-4])
-            name_bbox_clipping2 = '%s_forclipping2.GeoJSON' % (shapefile[0:-4])
+            ## Create the polygon for cropping (convex hull in EPSG:3035, easting/northing order)
+            tmpdir = tempfile.mkdtemp()
+            name_bbox_clipping2 = '%s/forclipping.GeoJSON' % (tmpdir)
             schema = {
                 'geometry': 'Polygon',
                 'properties' : {'id':'int'}
                 }
-            cmdi = 'ogr2ogr -f "GeoJSON" -t_srs EPSG:3035 %s %s' % (name_bbox_clipping1,shapefile)
-            os.system(cmdi)
-            with fiona.open(name_bbox_clipping1) as in_file, fiona.open(name_bbox_clipping2, 'w', 'GeoJSON', schema) as out_file:
-                for index, row in enumerate(in_file):
-                    line = shape(row['geometry'])
-                    hull = line.convex_hull
+            with fiona.open(name_bbox_clipping2, 'w', 'GeoJSON', schema, crs='EPSG:3035') as out_file:
+                for index, ROi in enumerate(listROIepsg3035):
+                    hull = shapely.transform(ROi,lambda coords: coords[:,::-1]).convex_hull
                     out_file.write({
                         'geometry': mapping(hull),
                         'properties': {'id': index},
@@ -533,10 +607,10 @@ def dataclipping(**kwargs):
             cmdi = 'rio mask %s %s --crop --geojson-mask %s --overwrite' %(fi,newname,name_bbox_clipping2)
             os.system(cmdi)
     
-            if os.path.isfile(name_bbox_clipping1):
-                os.remove(name_bbox_clipping1)
-            if os.path.isfile(name_bbox_clipping2):
-                os.remove(name_bbox_clipping2)
+            shutil.rmtree(tmpdir)
+
+            if manifest:
+                manifest.updatemerged(fi.split('/')[-1][0:-5],'clipped')
 
         elif 'cropped' in fi or 'clipped' in fi:
             if verbose:
@@ -546,6 +620,9 @@ def dataclipping(**kwargs):
                 print('\t%d / %d file(s): The file %s has not been found...' % (it,ittotal,fi))
 
         it = it + 1
+
+    if manifest:
+        manifest.close()
         
 ################################################################################
 ################################################################################
@@ -556,15 +633,17 @@ def dataclipping(**kwargs):
 ################################################################################
 ## Sub-function to merge the .tiff files
 ################################################################################
-def filemergingtiff(inputdir,outputdir,name,listfile,verbose):
+def filemergingtiff(inputdir,outputdir,name,listfile,verbose,dictpath=None):
+
+    if dictpath is None:
+        dictpath = findfiles(inputdir,'tiff')
 
     if os.path.isfile("%s/%s.tiff" % (outputdir,name)):
         os.remove("%s/%s.tiff" % (outputdir,name))
 
     cmdi= ["gdal_merge.py", "-o", "%s/%s.tiff" % (outputdir,name), "-n -9999 -a_nodata -9999"]
     for fi in listfile:
-        pathfi = glob.glob('%s/*/*/*/%s.tiff' % (inputdir,fi))[0]
-        cmdi.append(pathfi)
+        cmdi.append(dictpath[fi])
     
     cmdi = ' '.join(cmdi)
     if verbose:
@@ -574,22 +653,26 @@ def filemergingtiff(inputdir,outputdir,name,listfile,verbose):
         subprocess.call(cmdi,shell=True,stdout=open(os.devnull, 'wb'))  
 
 ################################################################################
-## Sub-function to merge the .csv files
+## Sub-function to merge the .csv files (headers read once, data streamed by chunks)
 ################################################################################
-def filemergingcsv(inputdir,outputdir,name,listfile,paratosave):
+def filemergingcsv(inputdir,outputdir,name,listfile,paratosave,dictpath=None,chunksize=nbrowchunk,outputformat='csv',maxmemory=None):
 
-    ## Detect the headers
-    first_one = True
+    if dictpath is None:
+        dictpath = findfiles(inputdir,'csv')
+
+    ## Detect the headers (only the first line of each file)
+    listpath = []
+    listhead = []
     date_ts = []
     for fi in listfile:
-
-        # Detection of the file 
-        pathfi = glob.glob('%s/*/*/*/%s.csv' % (inputdir,fi))[0]
-        head = pd.read_csv(pathfi, index_col=0, nrows=0).columns.tolist()
+        pathfi = dictpath[fi]
+        head = pd.read_csv(pathfi, nrows=0).columns.tolist()
+        listpath.append(pathfi)
+        listhead.append(head)
 
         header_para = []
         header_ts = []
-        for hi in head:
+        for hi in head[1:]:
             if not '20' in hi:
                 header_para.append(hi)
             else:
@@ -599,59 +682,300 @@ def filemergingcsv(inputdir,outputdir,name,listfile,paratosave):
 
     date_ts = np.unique(date_ts)  
 
-    header_final = header_para
-    for ti in date_ts : 
-        header_final.append(ti)
+    ## Columns of the merged file
+    if paratosave == 'all':
+        list_save = header_para + date_ts.tolist()
+    else:
+        # Mandatory parameters
+        list_save = ['latitude', 'longitude', 'easting', 'northing', 'height', 'height_wgs84']
+        # Selected parameters
+        if isinstance(paratosave,list):
+            list_save = list_save + paratosave
+        else:
+            list_save = list_save + paratosave.split(',')
+        list_save = list(dict.fromkeys(list_save))
+
+    ## Memory budget (in MB): number of rows of the chunks
+    if not maxmemory is None:
+        chunksize = chunksizemerged(maxmemory,listhead,list_save)
 
-    ## Merge the files
-    first_one = True
-    for fi in listfile:
-        # Detection of the file 
-        pathfi = glob.glob('%s/*/*/*/%s.csv' % (inputdir,fi))[0]
+    # Column of NaN shared by all the missing columns (allocated once, never copied)
+    bufnan = np.full(chunksize,np.nan)
+    bufnan.flags.writeable = False
+
+    ## Merge the files: only the saved columns are read, missing columns are filled with NaN
+    pathout = '%s/%s.%s' % (outputdir,name,outputformat)
+    if outputformat == 'csv':
+        fout = open(pathout, 'w')
+    else:
+        # Columnar formats: the schema is fixed by the first chunk
+        fout = None
+        schema = None
+
+    try:
+        first_one = True
+        for pathfi, head in zip(listpath,listhead):
+            usecols = [head[0]] + [hi for hi in list_save if hi in head[1:]]
+
+            # One chunk is one row group: a row group never mixes two files (tiles)
+            for chunki in pd.read_csv(pathfi, index_col=0, usecols=usecols, chunksize=chunksize):
+                # Columns of the chunk and views of the NaN column: no copy of the data
+                dictcolumn = dict()
+                for hi in list_save:
+                    if hi in chunki.columns:
+                        dictcolumn[hi] = chunki[hi].to_numpy()
+                    else:
+                        dictcolumn[hi] = bufnan[:len(chunki)]
+                chunki = pd.DataFrame(dictcolumn, index=chunki.index, copy=False)
+                if outputformat == 'csv':
+                    chunki.to_csv(fout, sep=';', index=True, header=first_one)
+                else:
+                    if fout is None:
+                        schema = schemamerged(chunki.index.name,list_save)
+                        fout = openwriterarrow(pathout,schema,outputformat)
+                    chunki.index = chunki.index.astype(str)
+                    fout.write_table(pyarrow.Table.from_pandas(chunki, schema=schema, preserve_index=True))
+                first_one = False
+
+        # Files without data: the header is written anyway
+        if first_one:
+            datai = pd.DataFrame(columns=list_save,index=pd.Index([],name=listhead[0][0]))
+            if outputformat == 'csv':
+                datai.to_csv(fout, sep=';', index=True, header=True)
+            else:
+                schema = schemamerged(datai.index.name,list_save)
+                fout = openwriterarrow(pathout,schema,outputformat)
+                datai = pd.DataFrame({hi: pd.Series([],dtype='float64') for hi in list_save},index=pd.Index([],name=datai.index.name,dtype=str))
+                fout.write_table(pyarrow.Table.from_pandas(datai, schema=schema, preserve_index=True))
+    finally:
+        if not fout is None:
+            fout.close()
 
-        # Read the file
-        datai = pd.read_csv(pathfi,index_col=0)
-        # datai = pd.read_csv(pathfi,nrows=10,index_col=0)
-        head = pd.read_csv(pathfi, index_col=0, nrows=0).columns.tolist()
+################################################################################
+## Sub-function to get the number of rows of the chunks from a memory budget (in MB)
+################################################################################
+def chunksizemerged(maxmemory,listhead,list_save):
 
-        datamatrix = dict()
-        if paratosave == 'all':
-            for hi in header_final:
-                datamatrix[hi] = []
+    # A data line is as long as the header line (about 10 characters per column)
+    sizeline = max([sum([len(hi)+1 for hi in head]) for head in listhead])
 
+    # Per row: the text read and written, the parsed values and the NaN column
+    sizerow = 2*sizeline + 8*(len(list_save)+1) + 8
+
+    return max(nbrowchunkmin,int(maxmemory*1e6 // sizerow))
+
+################################################################################
+## Sub-function to get the schema of a merged file (string ID, float32 time series, float64 otherwise)
+################################################################################
+def schemamerged(nameindex,list_save):
+
+    # From the names only: the dtypes inferred by pandas can change between the chunks/tiles
+    listfield = [pyarrow.field(nameindex, pyarrow.string())]
+    dictdtype = dict()
+    for hi in list_save:
+        if (not hi in listcoordinate) and '20' in hi:
+            # Displacements of the time series
+            listfield.append(pyarrow.field(hi, pyarrow.float32()))
+            dictdtype[hi] = 'float32'
         else:
-            # Mandatory parameters
-            mand_para = ['latitude', 'longitude', 'easting', 'northing', 'height', 'height_wgs84']
-            for hi in mand_para:
-                datamatrix[hi] = []
-            # Selected parameters
-            if isinstance(paratosave,list):
-                for hi in paratosave:
-                    datamatrix[hi] = []
+            listfield.append(pyarrow.field(hi, pyarrow.float64()))
+            dictdtype[hi] = 'float64'
+
+    # Metadata of pandas: the ID column is read back as the index
+    dataempty = pd.DataFrame({hi: pd.Series([],dtype=dictdtype[hi]) for hi in list_save},index=pd.Index([],name=nameindex,dtype=str))
+
+    return pyarrow.schema(listfield, metadata=pyarrow.Schema.from_pandas(dataempty, preserve_index=True).metadata)
+
+################################################################################
+## Sub-function to open a writer of a columnar file (Parquet: statistics on the ID and the coordinates)
+################################################################################
+def openwriterarrow(pathfile,schema,outputformat):
+
+    if outputformat == 'parquet':
+        liststats = [schema.names[0]] + [hi for hi in schema.names if hi in listcoordinate]
+        return pyarrow.parquet.ParquetWriter(pathfile, schema, compression=compressionarrow, write_statistics=liststats)
+    else:
+        # Feather (version 2) is the Arrow IPC file format
+        return pyarrow.ipc.new_file(pathfile, schema, options=pyarrow.ipc.IpcWriteOptions(compression=compressionarrow))
+
+################################################################################
+## Sub-function to clip a columnar file (Parquet row groups outside of the ROIs are not read)
+################################################################################
+def fileclippingarrow(pathfile,newname,listROIepsg3035):
+
+    # Bounds of the ROIs (northing, easting, as the EGMS files)
+    nmin, emin, nmax, emax = shapely.total_bounds(np.array(listROIepsg3035,dtype=object))
+    for ROi in listROIepsg3035:
+        shapely.prepare(ROi)
+
+    outputformat = pathfile.split('.')[-1]
+    if outputformat == 'parquet':
+        fin = pyarrow.parquet.ParquetFile(pathfile)
+        schema = fin.schema_arrow
+        nbblock = fin.num_row_groups
+    else:
+        fin = pyarrow.ipc.open_file(pathfile)
+        schema = fin.schema
+        nbblock = fin.num_record_batches
+
+    fout = openwriterarrow(newname,schema,outputformat)
+    try:
+        for i1 in range(nbblock):
+            if outputformat == 'parquet':
+                # Statistics of the row group: skipped if outside of the ROIs
+                stats = dict()
+                rowgroup = fin.metadata.row_group(i1)
+                for i2 in range(rowgroup.num_columns):
+                    columni = rowgroup.column(i2)
+                    if columni.path_in_schema in ['easting', 'northing'] and columni.is_stats_set and columni.statistics.has_min_max:
+                        stats[columni.path_in_schema] = (columni.statistics.min, columni.statistics.max)
+                if 'easting' in stats and 'northing' in stats:
+                    if stats['easting'][1] < emin or stats['easting'][0] > emax or stats['northing'][1] < nmin or stats['northing'][0] > nmax:
+                        continue
+                tablei = fin.read_row_group(i1)
             else:
-                for hi in paratosave.split(','):
-                    datamatrix[hi] = []
-
-        # Merging 
-        list_save = list(datamatrix.keys())
-        for mi in list_save:
-            ni = np.where(mi == np.array(head))[0]          
-            if not len(ni) == 0:
-                datamatrix[mi] = datai[head[ni[0]]]
-            else: 
-                datamatrix[mi] = datai[head[-1]]
-                datamatrix[mi] = np.where(np.isnan(datamatrix[mi])==0, np.nan, datamatrix[mi])
-            
-        pdfdframetosave = pd.DataFrame(data=datamatrix)
-        # print(pdfdframetosave)
+                tablei = pyarrow.Table.from_batches([fin.get_batch(i1)])
 
-        # Save the file 
-        if first_one:
-            pdfdframetosave.to_csv('%s/%s.csv' % (outputdir,name), mode='w', sep=';', index=True, header = True)
-        else:
-            pdfdframetosave.to_csv('%s/%s.csv' % (outputdir,name), mode='a', sep=';', index=True, header = False)
+            northing = tablei.column('northing').to_numpy(zero_copy_only=False)
+            easting = tablei.column('easting').to_numpy(zero_copy_only=False)
+            test = np.zeros(len(tablei),dtype=bool)
+            for ROi in listROIepsg3035:
+                test = test | shapely.contains_xy(ROi,northing,easting)
 
-        first_one = False
+            fout.write_table(tablei.filter(pyarrow.array(test)))
+    finally:
+        fout.close()
+
+################################################################################
+## Sub-function to list the groups of files to merge (name of the merged file, files)
+################################################################################
+def listgroupmerged(filedict,release,level,track,L3compall,onlyL3=False):
+
+    listgroup = []
+    for ri in release:
+        for li in level:
+            if li == 'L3':
+                listkey = L3compall
+            elif onlyL3:
+                continue
+            else:
+                listkey = track
+            for ki in listkey:
+                if ki in filedict[ri].get(li,{}):
+                    listgroup.append((filedict[ri][li][ki]['Name'], filedict[ri][li][ki]['Files']))
+
+    return listgroup
+
+################################################################################
+## Sub-function to merge a group in a worker (the error is returned, not raised)
+################################################################################
+def mergeworker(function,name,listfile,args):
+
+    try:
+        function(*args)
+    except Exception as e:
+        return name, listfile, '%s: %s' % (type(e).__name__,e)
+
+    return name, listfile, None
+
+################################################################################
+## Sub-function to merge the groups with a pool of processes (errors collected per group)
+################################################################################
+def mergegroups(function,listgroup,listargs,nbworkers,manifest,verbose):
+
+    errors = dict()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=nbworkers,mp_context=egmsapitools.get_mpcontext()) as executor:
+        listfuture = [executor.submit(mergeworker,function,name_file,file_list,argsi) for ((name_file, file_list), argsi) in zip(listgroup,listargs)]
+
+        h = 1
+        for future in concurrent.futures.as_completed(listfuture):
+            name_file, file_list, error = future.result()
+            if error is None:
+                for fi in file_list:
+                    manifest.update(fi,'merged',mergedfile=name_file)
+                if verbose:
+                    print('%d / %d group(s): Merging for %s' % (h,len(listgroup),name_file))
+            else:
+                errors[name_file] = error
+                print('%d / %d group(s): Error during the merging of %s: %s' % (h,len(listgroup),name_file,error))
+            h = h + 1
+
+    if errors:
+        print('\t%d group(s) not merged: %s' % (len(errors),', '.join(sorted(errors))))
+
+    return errors
+
+################################################################################
+## Sub-function to get the number of groups merged at the same time (limited by the memory)
+################################################################################
+def nbworkersmerged(nbworkers,maxmemory,listmemory):
+
+    if maxmemory is None:
+        maxmemory = availablememory()
+    nbworkers = min(nbworkers,max(len(listmemory),1))
+    if maxmemory is None or not listmemory:
+        return nbworkers
+
+    # The largest groups must fit together in the memory
+    nbmax = int(maxmemory*1e6 // max(max(listmemory),1))
+
+    return max(1,min(nbworkers,nbmax))
+
+################################################################################
+## Sub-function to get the available memory in MB (None if unknown)
+################################################################################
+def availablememory():
+
+    # Linux: free memory and reclaimable page cache
+    try:
+        with open('/proc/meminfo') as fin:
+            for line in fin:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024 / 1e6
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # Other systems: free memory only
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (ValueError, OSError, AttributeError):
+        return None
+
+################################################################################
+## Sub-function to estimate the memory used to merge .csv files (in bytes, one chunk in memory)
+################################################################################
+def memorymergedcsv(listpath,chunksize=nbrowchunk):
+
+    if not listpath:
+        return 0
+
+    # A data line is as long as the header line (about 10 characters per column)
+    pathmax = max(listpath,key=os.path.getsize)
+    with open(pathmax) as fin:
+        sizeline = len(fin.readline())
+
+    # Text and parsed values of the chunk (about 3 times the text)
+    return 3*min(os.path.getsize(pathmax),chunksize*sizeline)
+
+################################################################################
+## Sub-function to estimate the memory used to merge .tiff files (in bytes, the mosaic is in memory)
+################################################################################
+def memorymergedtiff(listpath):
+
+    return 2*sum([os.path.getsize(pathfi) for pathfi in listpath])
+
+################################################################################
+## Sub-function to get the paths of the files of a type (name => path, one scan of the directory)
+################################################################################
+def findfiles(inputdir,ext):
+
+    dictpath = dict()
+    for pathfi in sorted(glob.glob('%s/*/*/*/*.%s' % (inputdir,ext))):
+        namei = os.path.basename(pathfi)[:-len(ext)-1]
+        if not namei in dictpath:
+            dictpath[namei] = pathfi
+
+    return dictpath
 
 ################################################################################
 ## Sub-function to convert the list to a merged dictionary
@@ -708,3 +1032,22 @@ def listtodictmerged(list):
     L3compall = np.unique(L3compall)
 
     return filedict, release, level, track, L3compall
+
+if __name__ == "__main__":
+    ## Check: merge of two tiles whose columns have different dtypes (integer, then fractional values)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i1, (namei, rmsei) in enumerate([('EGMS_L2b_088_0001_IW2_VV', np.arange(100)), ('EGMS_L2b_088_0002_IW2_VV', np.arange(100)+0.5)]):
+            os.makedirs('%s/%d/a/b' % (tmpdir,i1))
+            datai = pd.DataFrame({'pid': np.arange(100)+100*i1, 'easting': 3e6+rmsei, 'northing': 3e6+rmsei, 'rmse': rmsei, '20180101': rmsei})
+            datai.to_csv('%s/%d/a/b/%s.csv' % (tmpdir,i1,namei), index=False)
+        listformat_check = ['csv'] if pyarrow is None else listformat
+        for formati in listformat_check:
+            filemergingcsv(tmpdir,tmpdir,'merged',['EGMS_L2b_088_0001_IW2_VV','EGMS_L2b_088_0002_IW2_VV'],'rmse,20180101',chunksize=60,outputformat=formati)
+            if formati == 'csv':
+                datamerged = pd.read_csv('%s/merged.csv' % (tmpdir),sep=';')
+            elif formati == 'parquet':
+                datamerged = pyarrow.parquet.read_table('%s/merged.parquet' % (tmpdir)).to_pandas()
+            else:
+                datamerged = pyarrow.ipc.open_file('%s/merged.feather' % (tmpdir)).read_all().to_pandas()
+            assert len(datamerged) == 200
+            assert np.allclose(datamerged['rmse'].to_numpy(), np.concatenate([np.arange(100), np.arange(100)+0.5]))
@@ -0,0 +1,450 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import time
+import random
+import threading
+import datetime
+import email.utils
+import hashlib
+import http.client
+import ssl
+import urllib.parse
+import urllib.error
+
+## HTTP status codes used by the EGMS portal to slow down the users
+codethrottle = [429, 462, 503]
+
+## HTTP status codes of the redirections
+coderedirect = [301, 302, 303, 307, 308]
+
+## Session shared by the toolkit (created at the first use)
+sharedsession = None
+lockshared = threading.Lock()
+
+################################################################################
+## Function to convert the Retry-After header into seconds
+################################################################################
+def parse_retryafter(value):
+
+    if value is None:
+        return 0.0
+
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        dateretry = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if dateretry.tzinfo is None:
+        dateretry = dateretry.replace(tzinfo=datetime.timezone.utc)
+
+    return max(0.0, (dateretry - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+################################################################################
+## Creation of a class to limit the rate of the requests (per host)
+################################################################################
+class egmsratelimiter:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,rate=1.0,burst=4,backoffbase=2.0,backoffmax=300.0):
+        self.rate = rate                # Requests per second (per host)
+        self.burst = burst              # Size of the token bucket (per host)
+        self.backoffbase = backoffbase  # First backoff delay in s
+        self.backoffmax = backoffmax    # Maximal backoff delay in s
+        self.hosts = dict()
+        self.throttledtime = 0.0
+        self.nbthrottled = 0
+        self.lock = threading.Lock()
+
+    ################################################################################
+    ## Function to get the bucket of a host
+    ################################################################################
+    def bucket(self,url):
+
+        host = urllib.parse.urlsplit(url).netloc
+        if not host in self.hosts:
+            self.hosts[host] = {'tokens': float(self.burst),
+                                'last': time.monotonic(),
+                                'blockeduntil': 0.0,
+                                'nbfail': 0}
+        return self.hosts[host]
+
+    ################################################################################
+    ## Function to wait for a token before a request
+    ################################################################################
+    def acquire(self,url):
+
+        timewait = 0.0
+        while True:
+            with self.lock:
+                bucketi = self.bucket(url)
+                now = time.monotonic()
+
+                if now < bucketi['blockeduntil']:
+                    delay = bucketi['blockeduntil'] - now
+                else:
+                    bucketi['tokens'] = min(float(self.burst), bucketi['tokens'] + (now - bucketi['last']) * self.rate)
+                    bucketi['last'] = now
+                    if bucketi['tokens'] >= 1.0:
+                        bucketi['tokens'] = bucketi['tokens'] - 1.0
+                        self.throttledtime = self.throttledtime + timewait
+                        return timewait
+                    delay = (1.0 - bucketi['tokens']) / self.rate
+
+            time.sleep(delay)
+            timewait = timewait + delay
+
+    ################################################################################
+    ## Function to report a successful request
+    ################################################################################
+    def success(self,url):
+
+        with self.lock:
+            self.bucket(url)['nbfail'] = 0
+
+    ################################################################################
+    ## Function to report a throttled request (exponential backoff with jitter)
+    ################################################################################
+    def throttled(self,url,retryafter=None):
+
+        with self.lock:
+            bucketi = self.bucket(url)
+            backoff = min(self.backoffmax, self.backoffbase * 2**bucketi['nbfail'])
+            delay = max(parse_retryafter(retryafter), random.uniform(backoff/2, backoff))
+            bucketi['nbfail'] = bucketi['nbfail'] + 1
+            bucketi['tokens'] = 0.0
+            bucketi['blockeduntil'] = max(bucketi['blockeduntil'], time.monotonic() + delay)
+            bucketi['last'] = bucketi['blockeduntil']
+            self.nbthrottled = self.nbthrottled + 1
+
+        return delay
+
+################################################################################
+## Function to get the session shared by the toolkit
+################################################################################
+def get_session():
+
+    global sharedsession
+    with lockshared:
+        if sharedsession is None:
+            sharedsession = egmssession()
+
+    return sharedsession
+
+################################################################################
+## Creation of a class to manage a pool of keep-alive HTTP connections
+################################################################################
+class egmssession:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,maxconnections=16,timeout=60,maxredirect=5):
+        self.maxconnections = maxconnections  # Maximal number of idle connections kept per host
+        self.timeout = timeout
+        self.maxredirect = maxredirect
+        self.pool = dict()
+        self.nbconnections = 0
+        self.lock = threading.Lock()
+        self.sslcontext = ssl.create_default_context()
+
+    ################################################################################
+    ## Function to get a connection (reused if possible)
+    ################################################################################
+    def getconnection(self,key):
+
+        with self.lock:
+            if self.pool.get(key):
+                return self.pool[key].pop(), True
+
+        return self.newconnection(key), False
+
+    ################################################################################
+    ## Function to open a new connection
+    ################################################################################
+    def newconnection(self,key):
+
+        with self.lock:
+            self.nbconnections = self.nbconnections + 1
+
+        if key[0] == 'https':
+            return http.client.HTTPSConnection(key[1],timeout=self.timeout,context=self.sslcontext)
+        else:
+            return http.client.HTTPConnection(key[1],timeout=self.timeout)
+
+    ################################################################################
+    ## Function to give back a connection to the pool
+    ################################################################################
+    def releaseconnection(self,key,connection):
+
+        with self.lock:
+            if not key in self.pool:
+                self.pool[key] = []
+            if len(self.pool[key]) < self.maxconnections:
+                self.pool[key].append(connection)
+                return
+        connection.close()
+
+    ################################################################################
+    ## Function to send a request (the redirections are followed)
+    ################################################################################
+    def open(self,url,method='GET',headers=None):
+
+        if headers is None:
+            headers = dict()
+
+        for nbredirect in range(self.maxredirect+1):
+            urlsplit = urllib.parse.urlsplit(url)
+            key = (urlsplit.scheme, urlsplit.netloc)
+            pathurl = urlsplit.path or '/'
+            if urlsplit.query:
+                pathurl = '%s?%s' % (pathurl,urlsplit.query)
+
+            connection, reused = self.getconnection(key)
+            try:
+                connection.request(method,pathurl,headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle connection: retry once with a new connection
+                connection.close()
+                if not reused:
+                    raise
+                connection = self.newconnection(key)
+                connection.request(method,pathurl,headers=headers)
+                response = connection.getresponse()
+            except Exception:
+                connection.close()
+                raise
+
+            if response.status in coderedirect and response.getheader('Location'):
+                egmsresponse(self,key,connection,response).discard()
+                url = urllib.parse.urljoin(url,response.getheader('Location'))
+                if response.status == 303:
+                    method = 'GET'
+                continue
+
+            if response.status >= 400:
+                egmsresponse(self,key,connection,response).discard()
+                raise urllib.error.HTTPError(url,response.status,response.reason,response.headers,None)
+
+            return egmsresponse(self,key,connection,response)
+
+        raise urllib.error.URLError('Too many redirections for %s' % (url))
+
+    ################################################################################
+    ## Function to send a HEAD request
+    ################################################################################
+    def head(self,url,headers=None):
+
+        response = self.open(url,method='HEAD',headers=headers)
+        response.discard()
+
+        return response.status, response.headers
+
+    ################################################################################
+    ## Function to close all the connections
+    ################################################################################
+    def close(self):
+
+        with self.lock:
+            for key in self.pool:
+                for connection in self.pool[key]:
+                    connection.close()
+            self.pool = dict()
+
+################################################################################
+## Creation of a class for the responses of the session
+################################################################################
+class egmsresponse:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,session,key,connection,response):
+        self.session = session
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    ################################################################################
+    ## Function to read the body
+    ################################################################################
+    def read(self,size=-1):
+        return self.response.read(size)
+
+    ################################################################################
+    ## Function to read the end of the body and close the response
+    ################################################################################
+    def discard(self):
+        self.response.read()
+        self.close()
+
+    ################################################################################
+    ## Function to close the response (the connection is kept alive if possible)
+    ################################################################################
+    def close(self):
+
+        if self.connection is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.session.releaseconnection(self.key,self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+################################################################################
+## Creation of a class to compute a checksum during a download (chunk callback)
+################################################################################
+class egmshashcallback:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self):
+        self.hashfile = hashlib.sha256()
+        self.size = 0
+
+    ################################################################################
+    ## Function to hash the data already stored (resumed download)
+    ################################################################################
+    def prime(self,pathfile,chunksize=1024*1024):
+
+        self.hashfile = hashlib.sha256()
+        self.size = 0
+        with open(pathfile,'rb') as fin:
+            for chunk in iter(lambda: fin.read(chunksize), b''):
+                self.hashfile.update(chunk)
+                self.size = self.size + len(chunk)
+
+    def __call__(self,chunk,sizedone,totalsize):
+
+        # The download restarted from the first byte
+        if sizedone - len(chunk) != self.size:
+            self.hashfile = hashlib.sha256()
+            self.size = 0
+        self.hashfile.update(chunk)
+        self.size = sizedone
+
+    ################################################################################
+    ## Function to get the checksum
+    ################################################################################
+    def hexdigest(self):
+        return self.hashfile.hexdigest()
+
+################################################################################
+## Function to download a file into a .part file (resumed with HTTP Range requests)
+################################################################################
+def downloadresume(url,pathfile,callbacks=[],chunksize=1024*1024,session=None):
+
+    pathpart = '%s.part' % (pathfile)
+    if os.path.isfile(pathpart):
+        sizepart = os.path.getsize(pathpart)
+    else:
+        sizepart = 0
+
+    try:
+        with open(pathpart,'ab') as fout:
+            totalsize = downloadstream(url,fout,sizedone=sizepart,callbacks=callbacks,chunksize=chunksize,session=session)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and sizepart > 0:
+            # The range starts after the end of the file: the .part file is complete or corrupted
+            totalsize = parse_contentrange(e.headers.get('Content-Range'))
+            if totalsize == sizepart:
+                return pathpart, totalsize
+            os.remove(pathpart)
+        raise
+
+    return pathpart, totalsize
+
+################################################################################
+## Function to download a file into a file object (resumed after sizedone bytes)
+################################################################################
+def downloadstream(url,fout,sizedone=0,callbacks=[],chunksize=1024*1024,session=None):
+
+    if session is None:
+        session = get_session()
+
+    headers = dict()
+    if sizedone > 0:
+        headers['Range'] = 'bytes=%d-' % (sizedone)
+
+    with session.open(url,headers=headers) as response:
+        if response.status == 206:
+            totalsize = parse_contentrange(response.headers.get('Content-Range'))
+        else:
+            # The server ignored the range: restart from the first byte
+            sizedone = 0
+            fout.seek(0)
+            fout.truncate()
+            totalsize = response.headers.get('Content-Length')
+            if not totalsize is None:
+                totalsize = int(totalsize)
+
+        while True:
+            chunk = response.read(chunksize)
+            if not chunk:
+                break
+            fout.write(chunk)
+            sizedone = sizedone + len(chunk)
+            for callback in callbacks:
+                callback(chunk,sizedone,totalsize)
+
+    return totalsize
+
+################################################################################
+## Function to read the total size from the Content-Range header
+################################################################################
+def parse_contentrange(value):
+
+    if value is None or not '/' in value:
+        return None
+    totalsize = value.split('/')[-1].strip()
+    if totalsize == '*':
+        return None
+
+    return int(totalsize)
+
+################################################################################
+## Function to get the size of a remote file (HEAD, or GET of the first byte)
+################################################################################
+def remotesize(url,session=None):
+
+    if session is None:
+        session = get_session()
+
+    try:
+        status, headers = session.head(url)
+        if not headers.get('Content-Length') is None:
+            return int(headers.get('Content-Length'))
+    except urllib.error.HTTPError as e:
+        # Some servers do not accept the HEAD requests
+        if not e.code in [403, 405, 501]:
+            raise
+
+    response = session.open(url,headers={'Range': 'bytes=0-0'})
+    if response.status == 206:
+        response.discard()
+        return parse_contentrange(response.headers.get('Content-Range'))
+    # The server ignored the range: the connection is closed without reading the body
+    response.close()
+    if not response.headers.get('Content-Length') is None:
+        return int(response.headers.get('Content-Length'))
+
+    return None
@@ -0,0 +1,139 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import time
+import sqlite3
+import threading
+
+## Name of the manifest file stored in the output directory
+namemanifest = 'egmsmanifest.sqlite3'
+
+## Ordered states of a tile
+liststate = ['planned', 'downloaded', 'verified', 'unzipped', 'merged', 'clipped']
+
+################################################################################
+## Function to open the manifest of a directory
+################################################################################
+def openmanifest(outputdir,create=True):
+
+    if (not create) and (not os.path.isfile('%s/%s' % (outputdir,namemanifest))):
+        return None
+
+    return egmsmanifest(outputdir)
+
+################################################################################
+## Creation of a class to manage the job manifest (state of each tile)
+################################################################################
+class egmsmanifest:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,outputdir):
+        self.pathmanifest = '%s/%s' % (outputdir,namemanifest)
+        self.tiles = dict()
+        self.lock = threading.Lock()
+
+        if not os.path.isdir(outputdir):
+            os.mkdir(outputdir)
+
+        self.connection = sqlite3.connect(self.pathmanifest,check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS tiles (name TEXT PRIMARY KEY, level TEXT, release TEXT, state TEXT, size INTEGER, checksum TEXT, mergedfile TEXT, '
+                                'time_planned REAL, time_downloaded REAL, time_verified REAL, time_unzipped REAL, time_merged REAL, time_clipped REAL, duration_download REAL)')
+        self.connection.commit()
+
+        # Load the table once: the lookups are then done in the dict
+        cursor = self.connection.execute('SELECT * FROM tiles')
+        columns = [ci[0] for ci in cursor.description]
+        for row in cursor:
+            rowi = dict(zip(columns,row))
+            self.tiles[rowi['name']] = rowi
+
+    ################################################################################
+    ## Function to print the attributes
+    ################################################################################
+    def print(self):
+        for statei in liststate:
+            print('\t%s: %d tile(s)' % (statei,len([ti for ti in self.tiles.values() if ti['state'] == statei])))
+
+    ################################################################################
+    ## Function to get the state of a tile
+    ################################################################################
+    def state(self,name):
+
+        name = name.split('.')[0]
+        if name in self.tiles:
+            return self.tiles[name]['state']
+        else:
+            return None
+
+    ################################################################################
+    ## Function to check if a tile has reached a state
+    ################################################################################
+    def isdone(self,name,state):
+
+        statei = self.state(name)
+        if statei is None:
+            return False
+
+        return liststate.index(statei) >= liststate.index(state)
+
+    ################################################################################
+    ## Function to add a tile to the manifest
+    ################################################################################
+    def plan(self,name,level,release):
+
+        name = name.split('.')[0]
+        if not name in self.tiles:
+            self.update(name,'planned',level=level,release=release)
+
+    ################################################################################
+    ## Function to update the state (and the other fields) of a tile
+    ################################################################################
+    def update(self,name,state,**kwargs):
+
+        if not state in liststate:
+            raise ValueError('Unknown state of tile: %s' % (state))
+
+        name = name.split('.')[0]
+        with self.lock:
+            if not name in self.tiles:
+                self.tiles[name] = {'name': name}
+            rowi = self.tiles[name]
+            rowi['state'] = state
+            rowi['time_%s' % (state)] = time.time()
+            for ki in kwargs:
+                rowi[ki] = kwargs[ki]
+
+            columns = list(rowi.keys())
+            self.connection.execute('INSERT OR REPLACE INTO tiles (%s) VALUES (%s)' % (','.join(columns),','.join(['?']*len(columns))),
+                                    [rowi[ci] for ci in columns])
+            self.connection.commit()
+
+    ################################################################################
+    ## Function to update the state of the tiles of a merged file
+    ################################################################################
+    def updatemerged(self,mergedfile,state):
+
+        for name in [ti['name'] for ti in self.tiles.values() if ti.get('mergedfile') == mergedfile]:
+            self.update(name,state)
+
+    ################################################################################
+    ## Function to remove a tile from the manifest
+    ################################################################################
+    def remove(self,name):
+
+        name = name.split('.')[0]
+        with self.lock:
+            if name in self.tiles:
+                del self.tiles[name]
+                self.connection.execute('DELETE FROM tiles WHERE name = ?',[name])
+                self.connection.commit()
+
+    ################################################################################
+    ## Function to close the manifest
+    ################################################################################
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,181 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import time
+import pickle
+import hashlib
+import sqlite3
+import tempfile
+
+from functions import egmsbursttable
+
+## Name of the index of the cache
+namequeryindex = 'egmsquerycache.sqlite3'
+
+################################################################################
+## Function to save the search results (Data and DataL3) into a file
+################################################################################
+def savedata(pathfile,Data,DataL3):
+
+    # Write in a temporary file first: the file appears complete or not at all
+    (fd, pathtmp) = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(pathfile)),suffix='.tmp')
+    with os.fdopen(fd,'wb') as fout:
+        # Bursts (binary table, memory-mapped at loading), then the L3 tiles
+        Data.write(fout)
+        pickle.dump(DataL3,fout,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(pathtmp,pathfile)
+
+################################################################################
+## Function to load the search results (Data and DataL3) from a file
+################################################################################
+def loaddata(pathfile):
+
+    try:
+        Data, offset = egmsbursttable.readbursttable(pathfile)
+    except ValueError:
+        # Pickle files of the previous versions (dict of bursts)
+        with open(pathfile,'rb') as fin:
+            results = pickle.load(fin)
+        if isinstance(results, dict) and 'Data' in results and 'DataL3' in results:
+            return egmsbursttable.fromdict(results['Data']), results['DataL3']
+        else:
+            return egmsbursttable.fromdict(results), dict()
+
+    with open(pathfile,'rb') as fin:
+        fin.seek(offset)
+        DataL3 = pickle.load(fin)
+
+    return Data, DataL3
+
+################################################################################
+## Function to open the query cache (None if disabled)
+################################################################################
+def openquerycache(dirmap,cachedir=None,cachesize=None):
+
+    if cachedir is None:
+        cachedir = os.environ.get('EGMSQUERYCACHE','%s/egmsquerycache' % (dirmap))
+    if cachedir is None or cachedir == 'None':
+        return None
+
+    if cachesize is None:
+        cachesize = float(os.environ.get('EGMSQUERYCACHESIZE',1000))
+
+    return egmsquerycache(cachedir,cachesize)
+
+################################################################################
+## Function to compute the key of a search
+################################################################################
+def makekey(listROI,level,Track,Pass,pathIDmap):
+
+    h = hashlib.sha256()
+    for ROi in listROI:
+        h.update(ROi.wkb)
+    h.update(repr([level, Track, Pass, pathIDmap]).encode())
+
+    return h.hexdigest()
+
+################################################################################
+## Creation of a class to manage the cache of the search results (ROI => bursts/tiles)
+################################################################################
+class egmsquerycache:
+
+    ################################################################################
+    ## Initialistion of the class
+    ################################################################################
+    def __init__(self,cachedir,cachesize=1000):
+        self.cachedir = cachedir
+        self.cachesize = cachesize  # Maximal size in MB
+
+        if not os.path.isdir('%s/results' % (cachedir)):
+            os.makedirs('%s/results' % (cachedir))
+
+        self.connection = sqlite3.connect('%s/%s' % (cachedir,namequeryindex),timeout=60)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, pathIDmap TEXT, size INTEGER, lastaccess REAL)')
+        self.connection.commit()
+
+    ################################################################################
+    ## Function to print the attributes
+    ################################################################################
+    def print(self):
+        nb, size = self.connection.execute('SELECT COUNT(*), COALESCE(SUM(size),0) FROM queries').fetchone()
+        print('\tQuery cache %s: %d search(es), %.2f / %.2f MB' % (self.cachedir,nb,size/1e6,self.cachesize))
+
+    ################################################################################
+    ## Function to get the path of a result
+    ################################################################################
+    def pathresult(self,key):
+        return '%s/results/%s.bin' % (self.cachedir,key)
+
+    ################################################################################
+    ## Function to get the results of a search (None if not in the cache)
+    ################################################################################
+    def get(self,key):
+
+        row = self.connection.execute('SELECT key FROM queries WHERE key = ?',[key]).fetchone()
+        if row is None:
+            return None
+
+        try:
+            Data, DataL3 = loaddata(self.pathresult(key))
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            self.remove(key)
+            return None
+
+        self.connection.execute('UPDATE queries SET lastaccess = ? WHERE key = ?',[time.time(),key])
+        self.connection.commit()
+
+        return Data, DataL3
+
+    ################################################################################
+    ## Function to add the results of a search
+    ################################################################################
+    def put(self,key,pathIDmap,Data,DataL3):
+
+        savedata(self.pathresult(key),Data,DataL3)
+
+        self.connection.execute('INSERT OR REPLACE INTO queries (key, pathIDmap, size, lastaccess) VALUES (?,?,?,?)',
+                                [key,pathIDmap,os.path.getsize(self.pathresult(key)),time.time()])
+        self.connection.commit()
+
+        self.evict()
+
+    ################################################################################
+    ## Function to remove a search
+    ################################################################################
+    def remove(self,key):
+
+        self.connection.execute('DELETE FROM queries WHERE key = ?',[key])
+        self.connection.commit()
+        if os.path.isfile(self.pathresult(key)):
+            os.remove(self.pathresult(key))
+
+    ################################################################################
+    ## Function to remove the searches done with another S1 burst ID map
+    ################################################################################
+    def invalidate(self,pathIDmap):
+
+        for (key,) in self.connection.execute('SELECT key FROM queries WHERE pathIDmap != ? AND pathIDmap != ?',[pathIDmap,'None']).fetchall():
+            self.remove(key)
+
+    ################################################################################
+    ## Function to remove the least recently used searches above the maximal size
+    ################################################################################
+    def evict(self):
+
+        sizetotal = self.connection.execute('SELECT COALESCE(SUM(size),0) FROM queries').fetchone()[0]
+        if sizetotal <= self.cachesize*1e6:
+            return
+
+        for (key, size) in self.connection.execute('SELECT key, size FROM queries ORDER BY lastaccess ASC').fetchall():
+            self.remove(key)
+            sizetotal = sizetotal - size
+            if sizetotal <= self.cachesize*1e6:
+                break
+
+    ################################################################################
+    ## Function to close the cache
+    ################################################################################
+    def close(self):
+        self.connection.close()
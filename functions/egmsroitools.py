@@ -0,0 +1,92 @@
+# -*- coding: iso-8859-1 -*-
+
+# Part of EMGStoolkit.py:
+
+import os
+import sys
+import uuid
+import numpy as np
+import fiona
+import pyproj
+import shapely
+from shapely.geometry import Polygon, LineString, MultiLineString, MultiPolygon, GeometryCollection, mapping
+from osgeo import gdal
+from osgeo import ogr
+
+source_crs = 'epsg:4326'
+target_crs = 'epsg:3035'
+
+latlon_to_meter = pyproj.Transformer.from_crs(source_crs, target_crs)
+
+################################################################################
+## Function to convert a geometry into a list of polygons (the closed lines are the contours)
+################################################################################
+def geometrytopolygons(geometry):
+
+    if isinstance(geometry, Polygon):
+        return [geometry]
+    elif isinstance(geometry, LineString):
+        if len(geometry.coords) >= 3:
+            return [Polygon(geometry.coords)]
+        else:
+            return []
+    elif isinstance(geometry, (MultiPolygon, MultiLineString, GeometryCollection)):
+        listpoly = []
+        for gi in geometry.geoms:
+            listpoly = listpoly + geometrytopolygons(gi)
+        return listpoly
+    else:
+        return []
+
+################################################################################
+## Function to read the polygons of a vector file (any projection, converted to EPSG:4326 in memory)
+## srcsrs: projection of the file if not given by the file (e.g., EPSG:4326 for the GMT files)
+################################################################################
+def readROIfile(pathfile,srcsrs=None):
+
+    options = '-f "ESRI Shapefile" -t_srs "EPSG:4326"'
+    if not srcsrs is None:
+        options = '%s -s_srs "%s"' % (options,srcsrs)
+
+    pathmem = '/vsimem/egmsroi_%s.shp' % (uuid.uuid4().hex)
+    if gdal.VectorTranslate(pathmem,pathfile,options=options) is None:
+        sys.exit('Error: the vector file %s cannot be converted into EPSG:4326 (projection missing?).' % (pathfile))
+
+    listROI = []
+    dataset = ogr.Open(pathmem)
+    if dataset is None:
+        sys.exit('Error: the vector file %s cannot be read.' % (pathfile))
+    for layer in dataset:
+        for feature in layer:
+            geometry = feature.GetGeometryRef()
+            if not geometry is None:
+                listROI = listROI + geometrytopolygons(shapely.from_wkb(bytes(geometry.ExportToWkb())))
+    dataset = None
+    gdal.GetDriverByName('ESRI Shapefile').Delete(pathmem)
+
+    return listROI
+
+################################################################################
+## Function to write the polygons into a vector file (contours as lines, as the previous bbox.shp files)
+################################################################################
+def exportROI(listROI,pathfile):
+
+    schema = {'geometry': 'LineString','properties': {'FID': 'int'}}
+
+    with fiona.open(pathfile, mode='w', driver='ESRI Shapefile',schema = schema, crs = "EPSG:4326") as output:
+        for idx, ROi in enumerate(listROI):
+            output.write({'geometry': mapping(LineString(ROi.exterior.coords)),'properties': {'FID': idx+1}})
+
+################################################################################
+## Function to project a polygon in EPSG:3035 (same axis order as the EGMS files: northing, easting)
+################################################################################
+def toepsg3035(ROi,segment=None):
+
+    if not segment is None:
+        ROi = shapely.segmentize(ROi,segment)
+
+    def transform(coords):
+        X, Y = latlon_to_meter.transform(coords[:,1],coords[:,0])
+        return np.stack([X, Y],axis=1)
+
+    return shapely.transform(ROi,transform)
@@ -3,12 +3,17 @@
 ## FROM https://land.copernicus.eu/en/technical-library/egms-product-description-document/@@download/file
 
 import math
+import numpy as np
 
 ## S1 IW timing parameters (NB! Must be 64-bit precision or higher!)
 TPRE  = 2.298687
 TBEAM = 2.758273
 TORB  = 12*86400/175
 
+## Burst size and azimuth sampling interval (to get the middle of a burst)
+AZ_SIZE = 1508
+DT_AZ = 0.0020555563
+
 def get_egms_burst_id(r, bc, swath, polarization):
         return "{:03d}-{:04d}-{:s}-{:s}".format(r, bc, swath, polarization)
 def get_esa_burst_cycle_id(delta_tb):
@@ -26,6 +31,22 @@ def get_egms_burst_cycle_id(r, anx_time):
     # EGMS burst ID is decomposed into (relative orbit, burst cycle within orbit).
     return (r, id_esa - id_esa_first + 1)
 
+def get_anx_mid(anx_time):
+    # Timing of the middle of a burst from the timing of its first line
+    return anx_time + AZ_SIZE/2*DT_AZ
+
+def get_esa_burst_cycle_id_array(delta_tb):
+    # Same as get_esa_burst_cycle_id for arrays (float64)
+    return np.floor((np.asarray(delta_tb,dtype=np.float64) - TPRE)/TBEAM).astype(np.int64) + 1
+
+def get_egms_burst_cycle_id_array(r, anx_time):
+    # Same as get_egms_burst_cycle_id for arrays of relative orbits and
+    # timings (e.g., all the bursts of the S1 burst ID map in one call)
+    r = np.asarray(r,dtype=np.int64)
+    id_esa_first = get_esa_burst_cycle_id_array((r-1)*TORB) + 1
+    id_esa = get_esa_burst_cycle_id_array((r-1)*TORB + np.asarray(anx_time,dtype=np.float64))
+    return (r, id_esa - id_esa_first + 1)
+
 if __name__ == "__main__":
     ## Example: burst covering Mulhouse in the EGMS ORR ascending data.
     ## Product: S1B_IW_SLC__1SDV_20180902T172257_20180902T172324_012539_01721C_6F69.SAFE
@@ -60,4 +81,14 @@ if __name__ == "__main__":
     assert bc_id_egms == (88, 282)
     # EGMS unique burst ID
     uid_egms = get_egms_burst_id(*bc_id_egms, "IW2", "VV")
-    assert uid_egms == "088-0282-IW2-VV"
\ No newline at end of file
+    assert uid_egms == "088-0282-IW2-VV"
+
+    ## Vectorized version: same results as the scalar version
+    assert get_anx_mid(anx_time) == anx_mid
+    r_array, bc_array = get_egms_burst_cycle_id_array([r], [anx_mid])
+    assert (int(r_array[0]), int(bc_array[0])) == (88, 282)
+    assert int(get_esa_burst_cycle_id_array((r-1)*TORB + anx_mid)) == 187151
+    r_all = np.repeat(np.arange(1,176),200)
+    anx_all = np.tile(np.linspace(0,TORB,200),175)
+    bc_all = get_egms_burst_cycle_id_array(r_all, anx_all)[-1]
+    assert all(bc_all[i] == get_egms_burst_cycle_id(int(r_all[i]), float(anx_all[i]))[-1] for i in range(len(r_all)))
\ No newline at end of file